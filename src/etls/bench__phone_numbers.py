@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Benchmark and correctness oracle for the phone number pipeline.
+
+Times candidate extraction per note, normalization per candidate and the
+extraction over whole order frames, reporting throughput and peak memory of
+each stage. Every stage is also checked against the reference
+implementations kept in etl__phone_numbers (extract_phone_numbers_reference,
+clean_phone_number_reference + is_valid_number), so an optimization cannot
+silently change which numbers are accepted. Exits with 1 on any mismatch.
+
+Notes come from orders TSVs (note column), archived phone number CSVs
+(phone_number column, the default) or synthetic orders generated with --rows.
+
+python3 src/etls/bench__phone_numbers.py
+python3 src/etls/bench__phone_numbers.py orders_2024-12-01_2025-03-31.tsv --repeat 5
+python3 src/etls/bench__phone_numbers.py --rows 100000 --save orders_synthetic.tsv
+"""
+
+import argparse
+import logging
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+
+import pandas as pd
+
+import etl__phone_numbers
+from etl__phone_numbers import (CACHE, DEFAULT_LANGUAGE, COUNTRY_LANGUAGES, INVALID_COLUMNS, SORT_COLUMNS,
+                                VALID_COLUMNS, clean_phone_number, clean_phone_number_reference,
+                                extract_columns, extract_phone_numbers, extract_phone_numbers_reference,
+                                extract_rows, is_valid_number)
+
+ARCHIVE_DIR = Path(__file__).resolve().parents[2] / 'data' / 'numbers' / 'archive'
+
+# Text found around numbers in real notes
+NOTE_NOISE = ['osoba', 'Kč', 'kč', 'zimmer nr 12', 'cena 1500 kč', '2 hod.', 'checkyeti', 'privátní výuka',
+              'zdarma', 'platí rental', 'instruktorka', 'telefonní číslo =', '5 let', 'č.p. 123', 'tel.',
+              'mobil:', 'během dne', 'Zimmer 204', 'hotel Sklář']
+NOTE_SEPARATORS = [', ', '; ', '\n', ' ', '  ', ' tel. ', ',']
+
+def random_digits(rng, count):
+    return ''.join(rng.choice('0123456789') for _ in range(count))
+
+def czech_number(rng):
+    digits = rng.choice('67') + random_digits(rng, 8)
+    return rng.choice([
+        digits,
+        f'{digits[:3]} {digits[3:6]} {digits[6:]}',
+        f'{digits[:3]}-{digits[3:6]}-{digits[6:]}',
+        f'+420 {digits}',
+        f'00420{digits}',
+        f'420{digits}',
+        f'+420{digits[:3]} {digits[3:]}',
+    ])
+
+def german_number(rng):
+    digits = '1' + rng.choice('567') + random_digits(rng, rng.randint(7, 10))
+    return rng.choice(['+49 ', '0049', '+490', '49', ' 0049 ']) + digits
+
+def polish_number(rng):
+    digits = rng.choice('45678') + random_digits(rng, 8)
+    return rng.choice(['+48 ', '0048', '48']) + digits
+
+def other_number(rng):
+    return rng.choice([
+        '+31 6' + random_digits(rng, 8),
+        '+353 8' + random_digits(rng, 8),
+        '+972 5' + random_digits(rng, 8),
+        '+43 6' + random_digits(rng, rng.randint(9, 10)),
+        # Landlines, short and malformed numbers that must stay invalid
+        '00431234567890',
+        '+4930123456',
+        '12345',
+        '+420 123 456 789',
+    ])
+
+def generate_orders(rows, seed=1):
+    """
+    Synthetic orders with messy notes, about 60% of the rows start a new
+    order and notes of repeat customers reuse earlier numbers
+    """
+    rng = random.Random(seed)
+    number_makers = [czech_number, czech_number, czech_number, german_number, polish_number, other_number]
+    seen_numbers = []
+
+    def note():
+        if rng.random() < 0.3:
+            return ''
+        parts = []
+        for _ in range(rng.choice([1, 1, 1, 2, 3])):
+            if seen_numbers and rng.random() < 0.3:
+                parts.append(rng.choice(seen_numbers))
+                continue
+            number = rng.choice(number_makers)(rng)
+            seen_numbers.append(number)
+            parts.append(number)
+            if rng.random() < 0.5:
+                parts.append(rng.choice(NOTE_NOISE))
+        return rng.choice(NOTE_SEPARATORS).join(parts)
+
+    records = []
+    id_order = 3000
+    for index in range(rows):
+        # Rows of one order share its note
+        if index == 0 or rng.random() < 0.6:
+            id_order += 1
+            order_note = note()
+        records.append({
+            'id_order': id_order,
+            'date_order': f'2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+            'language': rng.choice(['cz', 'de', 'en', '', ' CZ']),
+            'name_sponsor': rng.choice(['Jan Novák', 'Anna', '', 'Petr']),
+            'note': order_note,
+        })
+    return pd.DataFrame(records)
+
+def load_frames(paths):
+    """
+    Read orders TSVs, or phone numbers from archived CSVs as one-column frames
+    """
+    frames = []
+    for path in paths:
+        sep = '\t' if str(path).endswith('.tsv') else ','
+        df = pd.read_csv(path, sep=sep, low_memory=False)
+        if 'note' not in df.columns:
+            df = pd.DataFrame({'note': df['phone_number'].astype(str)})
+        frames.append(df)
+    return pd.concat(frames, ignore_index=True)
+
+def clean_reference(number):
+    """
+    Baseline normalization: clean_phone_number_reference then is_valid_number
+    """
+    cleaned, country, _ = clean_phone_number_reference(number)
+    if cleaned and is_valid_number(cleaned, country):
+        return cleaned, country
+    return None, None
+
+def extract_reference(df):
+    """
+    Baseline process_file extraction loop on the reference functions
+    """
+    output_data = []
+    invalid_numbers = []
+    for _, row in df.iterrows():
+        if pd.isna(row['note']):
+            continue
+        for number in extract_phone_numbers_reference(str(row['note'])):
+            cleaned, country = clean_reference(number)
+            if cleaned:
+                name_sponsor = row.get('name_sponsor', '')
+                output_data.append([row['id_order'], row['date_order'], cleaned, country,
+                                    COUNTRY_LANGUAGES.get(country, DEFAULT_LANGUAGE),
+                                    '' if pd.isna(name_sponsor) else name_sponsor])
+            else:
+                invalid_numbers.append([row['id_order'], row['date_order'], number, 'None', 'None'])
+    return (pd.DataFrame(output_data, columns=VALID_COLUMNS),
+            pd.DataFrame(invalid_numbers, columns=INVALID_COLUMNS))
+
+def frame_mismatches(expected, actual, sort):
+    """
+    Number of rows found in only one of two output frames, or if they hold
+    the same rows, the number of rows out of place
+    """
+    if sort:
+        expected = expected.sort_values(SORT_COLUMNS).drop_duplicates()
+        actual = actual.sort_values(SORT_COLUMNS).drop_duplicates()
+    expected = list(expected.astype(str).itertuples(index=False))
+    actual = list(actual.astype(str).itertuples(index=False))
+    different = Counter(expected) - Counter(actual) + (Counter(actual) - Counter(expected))
+    if different:
+        return sum(different.values())
+    return sum(left != right for left, right in zip(expected, actual))
+
+def measure(function, repeat):
+    """
+    Best time over repeat runs in seconds and peak traced memory in MB of
+    one more run, with a cold normalization cache for each
+    """
+    runs = []
+    for _ in range(repeat):
+        CACHE.memory.clear()
+        start = time.perf_counter()
+        function()
+        runs.append(time.perf_counter() - start)
+
+    CACHE.memory.clear()
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(runs), peak / 2**20
+
+def report(stage, seconds, peak, items, unit, baseline=None):
+    """
+    Print one timing line, with the speedup over baseline if given
+    """
+    speedup = f", {baseline / seconds:.1f}x" if baseline else ''
+    print(f"  {stage:<34} {seconds * 1e3:9.1f} ms {items / seconds:12,.0f} {unit}/s {peak:8.1f} MB peak{speedup}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark phone number extraction and check it against the reference")
+    parser.add_argument('paths', nargs='*', type=Path,
+                        help="Orders TSVs or phone number CSVs (default: archived phone number CSVs)")
+    parser.add_argument('--rows', type=int, help="Benchmark this many synthetic order rows instead of files")
+    parser.add_argument('--seed', type=int, default=1, help="Seed of the synthetic orders (default: 1)")
+    parser.add_argument('--save', type=Path, help="Write the synthetic orders to this TSV")
+    parser.add_argument('--repeat', type=int, default=3, help="Timing runs, the best one is reported")
+    args = parser.parse_args()
+
+    # process_file logs every step
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if args.rows:
+        df = generate_orders(args.rows, args.seed)
+        source = f"{args.rows} synthetic order rows (seed {args.seed})"
+        if args.save:
+            df.to_csv(args.save, sep='\t', index=False)
+            print(f"Synthetic orders saved to: {args.save}")
+    else:
+        paths = args.paths or sorted(ARCHIVE_DIR.glob('*.csv'))
+        if not paths:
+            print("Error: No input files found")
+            return
+        df = load_frames(paths)
+        source = f"{len(df)} rows from {len(paths)} files"
+
+    notes = df['note'].dropna().astype(str).tolist()
+    candidates = [candidate for note in notes for candidate in extract_phone_numbers_reference(note)]
+    orders = {'id_order', 'date_order'} <= set(df.columns)
+    print(f"Input: {source}, {len(notes)} notes, {len(candidates)} candidates")
+
+    # Correctness oracle against the reference implementations
+    mismatches = {
+        'candidates': sum(extract_phone_numbers(note) != extract_phone_numbers_reference(note) for note in notes),
+        'normalized': sum(clean_phone_number(number)[:2] != clean_reference(number) for number in candidates),
+    }
+    if orders:
+        expected_valid, expected_invalid = extract_reference(df)
+        for name, extract in [('column', extract_columns), ('row', extract_rows)]:
+            valid, invalid = extract(df)
+            mismatches[f'{name} valid rows'] = frame_mismatches(expected_valid, valid, sort=True)
+            mismatches[f'{name} invalid rows'] = frame_mismatches(expected_invalid, invalid, sort=False)
+    print("Mismatches against the reference:")
+    for name, count in mismatches.items():
+        print(f"  {name:<20} {count}")
+
+    print(f"Timings (best of {args.repeat}):")
+    reference, peak = measure(lambda: [extract_phone_numbers_reference(note) for note in notes], args.repeat)
+    report('extract_phone_numbers_reference', reference, peak, len(notes), 'notes')
+    seconds, peak = measure(lambda: [extract_phone_numbers(note) for note in notes], args.repeat)
+    report('extract_phone_numbers', seconds, peak, len(notes), 'notes', reference)
+
+    reference, peak = measure(lambda: [clean_reference(number) for number in candidates], args.repeat)
+    report('clean_phone_number_reference', reference, peak, len(candidates), 'numbers')
+    seconds, peak = measure(lambda: [clean_phone_number(number) for number in candidates], args.repeat)
+    report('clean_phone_number', seconds, peak, len(candidates), 'numbers', reference)
+
+    if orders:
+        reference, peak = measure(lambda: extract_reference(df), args.repeat)
+        report('reference extraction', reference, peak, len(df), 'rows')
+        seconds, peak = measure(lambda: extract_rows(df), args.repeat)
+        report('extract_rows', seconds, peak, len(df), 'rows', reference)
+        seconds, peak = measure(lambda: extract_columns(df), args.repeat)
+        report('extract_columns', seconds, peak, len(df), 'rows', reference)
+
+        # End to end including reading and writing, outputs go to a scratch directory
+        with tempfile.TemporaryDirectory() as scratch:
+            input_path = Path(scratch) / 'orders_2000-01-01_2000-01-01.tsv'
+            df.to_csv(input_path, sep='\t', index=False)
+            etl__phone_numbers.OUTPUT_BASE = Path(scratch) / 'output'
+            seconds, peak = measure(lambda: etl__phone_numbers.process_file(str(input_path), disk_cache=False,
+                                                                               store=False),
+                                    args.repeat)
+            report('process_file', seconds, peak, len(df), 'rows')
+
+    if any(mismatches.values()):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
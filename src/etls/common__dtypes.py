@@ -0,0 +1,96 @@
+"""
+Compact dtype profile shared by the ETL scripts.
+
+Frames are read with every text column as Python object strings. Low
+cardinality columns (season, level, language, country, type, result_type,
+...) and text repeated across rows (notes and names shared by the
+participants of an order) become categoricals, order ids int32 and the
+remaining free text Arrow-backed strings when pyarrow is installed. Values
+written to CSV stay exactly the same.
+
+df, report = compact_frame(df, 'orders_2024-12-01_2025-03-31.tsv')
+"""
+
+import numpy as np
+import pandas as pd
+
+# Always categorical, whatever their cardinality in a single file
+CATEGORY_COLUMNS = {'season', 'level', 'language', 'location_meeting', 'price_currency', 'group_size',
+                    'contact_sales', 'country', 'attempted_country', 'type', 'result_type'}
+# Integer columns that fit int32
+INT32_COLUMNS = {'id_order', 'participants'}
+# Other text columns with at most this share of distinct values become categoricals
+CATEGORY_MAX_RATIO = 0.5
+
+def arrow_string_dtype():
+    """
+    Arrow-backed string dtype with NaN as missing value like object columns,
+    None without pyarrow or on pandas before 2.1
+    """
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return None
+    try:
+        return pd.StringDtype('pyarrow', na_value=np.nan)
+    except TypeError:
+        pass
+    try:
+        return pd.StringDtype('pyarrow_numpy')
+    except (TypeError, ValueError):
+        return None
+
+TEXT_DTYPE = arrow_string_dtype()
+
+def is_text(series: pd.Series) -> bool:
+    """
+    True for string columns, object columns only if all values are strings
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return False
+    if series.dtype == object:
+        return pd.api.types.infer_dtype(series, skipna=True) in ('string', 'empty')
+    return pd.api.types.is_string_dtype(series.dtype)
+
+def compact_column(series: pd.Series) -> pd.Series:
+    """
+    Series in its compact dtype, unchanged if none applies
+    """
+    if series.name in INT32_COLUMNS and pd.api.types.is_integer_dtype(series.dtype):
+        info = np.iinfo(np.int32)
+        if series.empty or (series.min() >= info.min and series.max() <= info.max):
+            return series.astype(np.int32)
+        return series
+    if not is_text(series):
+        return series
+    if series.name in CATEGORY_COLUMNS or series.nunique() <= CATEGORY_MAX_RATIO * len(series):
+        return series.astype('category')
+    if TEXT_DTYPE is not None and series.dtype == object:
+        return series.astype(TEXT_DTYPE)
+    return series
+
+def frame_memory(df: pd.DataFrame) -> int:
+    """
+    Bytes held by df including the strings of object columns
+    """
+    return int(df.memory_usage(deep=True).sum())
+
+def format_bytes(size: int) -> str:
+    """
+    Size in KB below one MB, in MB above
+    """
+    return f"{size / 2**10:.1f} KB" if size < 2**20 else f"{size / 2**20:.1f} MB"
+
+def compact_frame(df: pd.DataFrame, label: str, exclude=()) -> tuple:
+    """
+    df with the compact dtype profile applied and a one line memory report.
+    Columns in exclude are left alone, e.g. sort keys whose order of ties
+    has to stay the same.
+    """
+    before = frame_memory(df)
+    df = df.assign(**{column: compact_column(df[column]) for column in df.columns
+                      if column not in exclude and isinstance(column, str)})
+    after = frame_memory(df)
+    report = (f"Memory of {label}: {len(df)} rows, {format_bytes(before)} -> {format_bytes(after)}"
+              f" ({after / before:.0%})" if before else f"Memory of {label}: empty")
+    return df, report
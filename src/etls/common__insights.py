@@ -0,0 +1,369 @@
+"""
+Shared building blocks of the insights ETLs (etl__fb_day, etl__fb_to_date).
+
+Insights files are turned into flat records that are accumulated column by
+column, each output frame is then built exactly once instead of
+concatenating a small frame per file. Files can be parsed and flattened in a
+process pool, with orjson when it is installed.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from functools import partial
+from pathlib import Path
+
+import pandas as pd
+
+# Faster JSON parsing when installed, the standard library otherwise
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_BACKEND = 'orjson' if orjson else 'json'
+
+# Index of the insights files per date= directory, next to the outputs
+INDEX_FILENAME = 'insights_index.json'
+INDEX_VERSION = 1
+# Ledger of the parsed files with their records, bump when the records change
+LEDGER_VERSION = 2
+
+VIDEO_METRICS = [
+    'video_p25_watched_actions',
+    'video_p50_watched_actions',
+    'video_p75_watched_actions',
+    'video_p100_watched_actions'
+]
+
+# Action lists indexed into one wide column per action type, by column prefix
+ACTION_FIELDS = {
+    'actions': 'actions',
+    'action_values': 'action_values',
+    'cost_per_action_type': 'cost_per_action',
+}
+
+# Output columns in their CSV order, the wide action columns follow
+INSIGHT_COLUMNS = ['name', 'type', 'reach', 'impressions', 'spend', *VIDEO_METRICS,
+                   'date_start', 'date_stop', 'result_type', 'results']
+
+def campaign_id(input_path):
+    """Campaign identifier of an insights path, the part after campaign=."""
+    return str(input_path).split('campaign=')[1].split('/')[0]
+
+def get_output_directory(input_path):
+    """
+    Transform input path to desired output path format.
+
+    From: /home/hylmarj/aps-goldsport-facebook/_scratch/campaign=adult_ski_beginner__traffic__120215321990480063/type=insights
+    To: /home/hylmarj/_scratch/staging-goldsport-analytics/goldsport__fa_adult_ski_beginner__traffic__120215321990480063___gsp_dataset___auto_full/method=auto_full/source=goldsport
+    """
+    campaign_part = campaign_id(input_path)
+
+    # Construct new path components
+    base_dir = '/home/hylmarj/_scratch/staging-goldsport-analytics'
+    campaign_dir = f'goldsport__fa_{campaign_part}___gsp_dataset___auto_full'
+    method_dir = 'method=auto_full'
+    source_dir = 'source=goldsport'
+
+    # Combine into final path
+    return Path(base_dir) / campaign_dir / method_dir / source_dir
+
+def action_index(actions):
+    """
+    action_type -> value of an insights action list in one pass, the first
+    entry of a type wins.
+    """
+    index = {}
+    try:
+        for action in actions or ():
+            index.setdefault(action.get('action_type'), action.get('value', 0))
+    except TypeError:
+        return {}
+    return index
+
+def action_value(index, action_type):
+    """Value of action_type as float, 0 if missing or not a number."""
+    if action_type not in index:
+        return 0
+    try:
+        return float(index[action_type])
+    except (TypeError, ValueError):
+        return 0
+
+def wide_actions(insights):
+    """
+    Every action type of the action lists as its own column, e.g.
+    actions__link_click or cost_per_action__lead. Values that are not
+    numbers are left empty.
+    """
+    columns = {}
+    for field, prefix in ACTION_FIELDS.items():
+        for action_type, value in action_index(insights.get(field)).items():
+            try:
+                columns[f'{prefix}__{action_type}'] = float(value)
+            except (TypeError, ValueError):
+                columns[f'{prefix}__{action_type}'] = None
+    return columns
+
+def wide_column_key(column):
+    """Sort key of the wide action columns, grouped by action list."""
+    prefix = column.split('__', 1)[0]
+    return list(ACTION_FIELDS.values()).index(prefix), column
+
+def insight_record(insights, name, record_type, date_start, date_stop, results):
+    """Flat record of one campaign or ad insights entry, with its wide action columns."""
+    return {
+        'name': name,
+        'type': record_type,
+        'reach': float(insights['reach']),
+        'impressions': float(insights['impressions']),
+        'spend': float(insights['spend']),
+        **{metric: action_value(action_index(insights.get(metric)), 'video_view') for metric in VIDEO_METRICS},
+        'date_start': date_start,
+        'date_stop': date_stop,
+        'result_type': insights['result_type'],
+        'results': results,
+        **wide_actions(insights)
+    }
+
+class RecordAccumulator:
+    """
+    Records appended as column lists, turned into a DataFrame once. Every
+    record has the fixed columns, other columns (the wide action columns)
+    are added when first seen and left empty for records without them.
+    """
+
+    def __init__(self, columns):
+        self.fixed = list(columns)
+        self.columns = {column: [] for column in columns}
+
+    def __len__(self):
+        return len(self.columns[self.fixed[0]])
+
+    def append(self, record):
+        size = len(self)
+        for column, value in record.items():
+            values = self.columns.get(column)
+            if values is None:
+                values = self.columns[column] = [None] * size
+            values.append(value)
+        if len(record) < len(self.columns):
+            for values in self.columns.values():
+                if len(values) == size:
+                    values.append(None)
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def to_frame(self):
+        wide = sorted(set(self.columns) - set(self.fixed), key=wide_column_key)
+        return pd.DataFrame({column: self.columns[column] for column in self.fixed + wide})
+
+def scan_date_dir(path):
+    """
+    Names of the day and to_date JSON files of one date= directory, files
+    not named after the directory date are left out.
+    """
+    date_str = path.name.split('=')[1]
+    day_names, to_date_names = [], []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            name = entry.name
+            if not name.endswith('.json') or date_str not in name or not entry.is_file():
+                continue
+            if 'to_date__' in name:
+                to_date_names.append(name)
+            elif 'date__' in name:
+                day_names.append(name)
+    return day_names, to_date_names
+
+def iso_date(value):
+    """argparse type of YYYY-MM-DD dates, kept as text to compare with directory names."""
+    return date.fromisoformat(value).isoformat()
+
+def write_json(path, data):
+    """
+    Write data as JSON through a temporary file, so the day and to_date
+    scripts running at once never read a half written file.
+    """
+    temp_path = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    with open(temp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(temp_path, path)
+
+def load_index(index_path, insights_dir):
+    """Cached directory index of insights_dir, empty if missing or stale."""
+    if index_path and index_path.exists():
+        with open(index_path) as f:
+            index = json.load(f)
+        if index.get('version') == INDEX_VERSION and index.get('insights_dir') == str(insights_dir):
+            return index['dirs']
+    return {}
+
+def in_date_range(date_str, since=None, until=None):
+    """True if the ISO date is within since..until, inclusive, either may be None."""
+    return not ((since and date_str < since) or (until and date_str > until))
+
+def latest_fetches(names):
+    """
+    File names without the ones fetched again later. The fetcher writes a
+    new file into the same date= directory on every fetch, named like the
+    previous one up to the fetch timestamp after the last ___.
+    """
+    latest = {}
+    for name in sorted(names):
+        latest[name.rsplit('___', 1)[0]] = name
+    return list(latest.values())
+
+def discover_files(insights_dir, since=None, until=None, index_path=None):
+    """
+    Day and to_date files of a campaign=<name>/type=insights directory, in
+    one pass over its date=YYYY-MM-DD directories only. Only the latest
+    fetch of a file is returned, so a re-fetched day is not counted twice.
+    With index_path, the file names of each directory are cached with its
+    mtime and only directories changed since the last run are listed
+    again. Directories
+    outside since..until (ISO dates, inclusive) with a cached listing are
+    not checked for changes, their files are still returned so outputs
+    keep covering every date.
+    """
+    insights_dir = Path(insights_dir)
+    cached = load_index(index_path, insights_dir)
+    dirs = {}
+    day_files, to_date_files = [], []
+    rescanned = 0
+    with os.scandir(insights_dir) as entries:
+        for entry in entries:
+            if not entry.name.startswith('date=') or not entry.is_dir():
+                continue
+            date_str = entry.name.split('=')[1]
+            listing = cached.get(entry.name)
+            if listing is None or (in_date_range(date_str, since, until)
+                                   and listing['mtime_ns'] != entry.stat().st_mtime_ns):
+                mtime_ns = entry.stat().st_mtime_ns
+                day_names, to_date_names = scan_date_dir(Path(entry.path))
+                listing = {'mtime_ns': mtime_ns, 'day': day_names, 'to_date': to_date_names}
+                rescanned += 1
+            dirs[entry.name] = listing
+            day_files.extend(insights_dir / entry.name / name for name in latest_fetches(listing['day']))
+            to_date_files.extend(insights_dir / entry.name / name for name in latest_fetches(listing['to_date']))
+
+    logging.info(f"Found {len(day_files)} day and {len(to_date_files)} to_date files "
+                 f"in {len(dirs)} date directories, {rescanned} listed")
+    if index_path and (rescanned or set(dirs) != set(cached)):
+        index_path.parent.mkdir(parents=True, exist_ok=True)
+        write_json(index_path, {'version': INDEX_VERSION, 'insights_dir': str(insights_dir), 'dirs': dirs})
+    return sorted(day_files), sorted(to_date_files)
+
+def load_json(file_path):
+    """Parse a JSON file with the JSON_BACKEND."""
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    return orjson.loads(data) if orjson else json.loads(data)
+
+def safe_flatten(flatten, file_path):
+    """flatten(file_path), an exception becomes the error of the whole file."""
+    try:
+        return flatten(file_path)
+    except Exception as e:
+        return None, None, str(e)
+
+def parse_files(file_paths, flatten, workers=1):
+    """
+    flatten(file_path) of every file as (campaign record, ad records, error),
+    in a pool of worker processes if more than one. Results come back in
+    file order whatever the number of workers.
+    """
+    if workers > 1 and len(file_paths) > 1:
+        chunksize = max(1, len(file_paths) // (workers * 4))
+        with ProcessPoolExecutor(workers) as pool:
+            return list(pool.map(partial(safe_flatten, flatten), file_paths, chunksize=chunksize))
+    return [safe_flatten(flatten, file_path) for file_path in file_paths]
+
+def log_parse_summary(file_count, skipped, errors):
+    """Log how many files were parsed, had no data or failed, and why."""
+    logging.info(f"Parsed {file_count} files with {JSON_BACKEND}: {file_count - skipped - len(errors)} with data, "
+                 f"{skipped} without data, {len(errors)} failed")
+    for file_path, error in errors:
+        logging.error(f"  Failed {file_path}: {error}")
+
+def file_hash(file_path):
+    """SHA-256 of the file content."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def ledger_paths(output_dir, kind):
+    """Ledger and records files of one kind of insights files (day, to_date)."""
+    return output_dir / f'insights_ledger_{kind}.json', output_dir / f'insights_records_{kind}.pkl'
+
+def load_ledger(ledger_path, records_path):
+    """Files and records of the last run, empty if missing or of another version."""
+    if ledger_path.exists() and records_path.exists():
+        with open(ledger_path) as f:
+            ledger = json.load(f)
+        if ledger.get('version') == LEDGER_VERSION:
+            with open(records_path, 'rb') as f:
+                return ledger['files'], pickle.load(f)
+    return {}, {}
+
+def file_date(file_path):
+    """ISO date of the date= directory holding an insights file."""
+    return Path(file_path).parent.name.split('=')[1]
+
+def parse_changed_files(file_paths, flatten, workers, output_dir, kind, full=False, since=None, until=None):
+    """
+    parse_files with a ledger of the processed files (size, mtime, hash)
+    next to the outputs, as a dict of file path to result in file order.
+    Only files new or changed since the last run are parsed, results of the
+    others come from the records saved with the ledger, so the outputs are
+    the same as from parsing everything. Known files of date directories
+    outside since..until are taken from the ledger without being checked,
+    full parses every file within the range again. Files gone from disk are
+    dropped with their records.
+    """
+    ledger_path, records_path = ledger_paths(output_dir, kind)
+    previous, records = load_ledger(ledger_path, records_path)
+    files, changed = {}, []
+    for file_path in file_paths:
+        key = os.path.abspath(file_path)
+        entry = previous.get(key)
+        known = entry is not None and key in records
+        in_range = in_date_range(file_date(file_path), since, until)
+        if known and not in_range:
+            # Listings outside the range are not refreshed, the file may be gone
+            if os.path.exists(file_path):
+                files[key] = entry
+            continue
+        stat = os.stat(file_path)
+        if known and not full and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            files[key] = entry
+            continue
+        digest = file_hash(file_path)
+        files[key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'hash': digest}
+        if full or not (known and entry['hash'] == digest):
+            changed.append(file_path)
+
+    for file_path, result in zip(changed, parse_files(changed, flatten, workers)):
+        records[os.path.abspath(file_path)] = result
+
+    removed = len(set(previous) - set(files))
+    logging.info(f"Ledger: {len(changed)} new or changed files parsed, "
+                 f"{len(files) - len(changed)} unchanged, {removed} removed")
+
+    if changed or removed or files != previous:
+        records = {key: records[key] for key in files}
+        with open(records_path, 'wb') as f:
+            pickle.dump(records, f, protocol=pickle.HIGHEST_PROTOCOL)
+        with open(ledger_path, 'w') as f:
+            json.dump({'version': LEDGER_VERSION, 'files': files}, f)
+    return {file_path: records[os.path.abspath(file_path)] for file_path in file_paths
+            if os.path.abspath(file_path) in files}
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Local SQLite fact store of the ETL outputs.
+
+etl__fb_day and etl__fb_to_date upsert their campaign and ad rows keyed on
+(campaign, kind, level, name, date_start, date_stop, line), etl__orders the
+season rows keyed on (season, id_order, line) and etl__phone_numbers the unique
+numbers keyed on phone_number. Questions across runs become indexed
+queries on the store instead of re-running the ETLs, and any query can be
+exported as CSV.
+
+python3 src/etls/common__store.py "SELECT date_stop, SUM(spend) FROM insights WHERE kind = 'day'
+    AND level = 'campaign' AND date_stop >= date('now', '-14 days') GROUP BY date_stop"
+python3 src/etls/common__store.py "SELECT * FROM orders WHERE season = '24/25'" --csv orders.csv
+"""
+
+import argparse
+import csv
+import json
+import sqlite3
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+STORE_PATH = Path("/home/hylmarj/_scratch/staging-goldsport-analytics/goldsport_facts.sqlite")
+
+# Concurrent ETL runs wait this long for the write lock
+BUSY_TIMEOUT = 60
+# Kept in PRAGMA user_version, bumped when the key of a table changes
+STORE_VERSION = 1
+
+INSIGHT_METRICS = ['reach', 'impressions', 'spend', 'video_p25_watched_actions', 'video_p50_watched_actions',
+                   'video_p75_watched_actions', 'video_p100_watched_actions', 'result_type', 'results']
+INSIGHT_KEY = ['campaign', 'kind', 'level', 'name', 'date_start', 'date_stop', 'line']
+
+ORDER_COLUMNS = ['id_order', 'line', 'date_order', 'season', 'level', 'language', 'location_meeting',
+                 'contact_sales', 'name_sponsor', 'name_participant', 'participants', 'age_participant',
+                 'date_lesson', 'timestamp_start_lesson', 'timestamp_end_lesson', 'duration_lesson_minutes',
+                 'price_currency', 'price_discount_percent', 'price_without_vat', 'price_to_pay', 'note']
+ORDER_KEY = ['season', 'id_order', 'line']
+
+PHONE_COLUMNS = ['phone_number', 'id_order', 'date_order', 'country', 'language', 'name_sponsor']
+PHONE_KEY = ['phone_number']
+# Fields of the order a number was first seen in, country belongs to the number itself
+PHONE_FIRST_SEEN = ['id_order', 'date_order', 'language', 'name_sponsor']
+# True when the inserted row is of an earlier order than the stored one, ties keep the stored row
+PHONE_EARLIER = ("COALESCE(excluded.date_order < phone_numbers.date_order, "
+                 "phone_numbers.date_order IS NULL AND excluded.date_order IS NOT NULL)")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS insights (
+    campaign TEXT NOT NULL, kind TEXT NOT NULL, level TEXT NOT NULL, name TEXT NOT NULL,
+    date_start TEXT NOT NULL, date_stop TEXT NOT NULL, line INTEGER NOT NULL,
+    reach REAL, impressions REAL, spend REAL,
+    video_p25_watched_actions REAL, video_p50_watched_actions REAL,
+    video_p75_watched_actions REAL, video_p100_watched_actions REAL,
+    result_type TEXT, results REAL,
+    -- Wide action columns of the row as a JSON object
+    actions TEXT,
+    PRIMARY KEY (campaign, kind, level, name, date_start, date_stop, line)
+);
+CREATE INDEX IF NOT EXISTS insights_date ON insights (date_stop, kind, level);
+CREATE INDEX IF NOT EXISTS insights_campaign ON insights (campaign, kind, date_stop);
+
+CREATE TABLE IF NOT EXISTS orders (
+    id_order INTEGER NOT NULL, line INTEGER NOT NULL, date_order TEXT, season TEXT NOT NULL, level TEXT,
+    language TEXT, location_meeting TEXT, contact_sales TEXT, name_sponsor TEXT, name_participant TEXT,
+    participants INTEGER, age_participant REAL, date_lesson TEXT,
+    timestamp_start_lesson TEXT, timestamp_end_lesson TEXT, duration_lesson_minutes REAL,
+    price_currency TEXT, price_discount_percent REAL, price_without_vat REAL, price_to_pay REAL, note TEXT,
+    PRIMARY KEY (season, id_order, line)
+);
+CREATE INDEX IF NOT EXISTS orders_date ON orders (date_order);
+
+CREATE TABLE IF NOT EXISTS phone_numbers (
+    phone_number TEXT PRIMARY KEY, id_order INTEGER, date_order TEXT, country TEXT, language TEXT,
+    name_sponsor TEXT
+);
+CREATE INDEX IF NOT EXISTS phone_numbers_date ON phone_numbers (date_order);
+"""
+
+def open_store(path=None):
+    """
+    Connection to the store, created with its schema if missing. WAL lets
+    readers query while an ETL writes.
+    """
+    path = Path(path or STORE_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(str(path), timeout=BUSY_TIMEOUT)
+    connection.execute("PRAGMA journal_mode = WAL")
+    if connection.execute("PRAGMA user_version").fetchone()[0] < STORE_VERSION:
+        # Tables of an older key are dropped, the next ETL runs fill them again
+        with connection:
+            connection.execute("DROP TABLE IF EXISTS insights")
+            connection.execute(f"PRAGMA user_version = {STORE_VERSION}")
+    connection.executescript(SCHEMA)
+    return connection
+
+def sql_value(value):
+    """Python value SQLite can store, None for missing values."""
+    if value is None or (not isinstance(value, (list, dict)) and pd.isna(value)):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    return value.item() if hasattr(value, 'item') else value
+
+def sql_rows(df, columns):
+    """Rows of the columns of df as tuples of SQLite values."""
+    return [tuple(map(sql_value, row)) for row in df[columns].astype(object).itertuples(index=False, name=None)]
+
+def upsert(connection, table, key, columns, rows, updates=None):
+    """
+    Insert rows, replacing the values of rows already stored under the same
+    key. updates maps columns to the SQL expression of their new value
+    instead, excluded.<column> being the value of the inserted row.
+    """
+    updates = ', '.join(f"{column} = {(updates or {}).get(column, f'excluded.{column}')}"
+                        for column in columns if column not in key)
+    connection.executemany(
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+        f"ON CONFLICT ({', '.join(key)}) DO UPDATE SET {updates}", rows)
+
+def insight_rows(df, campaign, kind, level):
+    """
+    Store rows of an insights output frame, wide action columns folded into
+    JSON. line numbers the rows of the same name and dates in frame order,
+    ads of the same name are separate rows as in the CSVs.
+    """
+    rows = pd.DataFrame({'campaign': campaign, 'kind': kind, 'level': level,
+                         'name': df['name'].astype(object).fillna(''),
+                         'date_start': pd.to_datetime(df['date_start']).dt.strftime('%Y-%m-%d'),
+                         'date_stop': pd.to_datetime(df['date_stop']).dt.strftime('%Y-%m-%d')}, index=df.index)
+    rows['line'] = rows.groupby(['name', 'date_start', 'date_stop'], sort=False).cumcount()
+    for column in INSIGHT_METRICS:
+        rows[column] = df[column].astype(object)
+    rows['results'] = pd.to_numeric(rows['results'], errors='coerce')
+    wide = [column for column in df.columns if '__' in column]
+    rows['actions'] = [json.dumps({column: value for column, value in zip(wide, values) if pd.notna(value)})
+                       for values in df[wide].itertuples(index=False, name=None)]
+    return rows
+
+def upsert_insights(campaign, kind, campaign_df, ads_df, path=None):
+    """
+    Upsert the campaign and ad rows of one insights ETL run (kind is day or
+    to_date). Rows of the campaign and kind that are gone from them are
+    deleted, so the store holds the rows of the CSVs.
+    """
+    rows = pd.concat([insight_rows(campaign_df, campaign, kind, 'campaign'),
+                      insight_rows(ads_df, campaign, kind, 'ad')], ignore_index=True)
+    columns = INSIGHT_KEY + INSIGHT_METRICS + ['actions']
+    connection = open_store(path)
+    try:
+        with connection:
+            connection.execute("DELETE FROM insights WHERE campaign = ? AND kind = ?", [campaign, kind])
+            upsert(connection, 'insights', INSIGHT_KEY, columns, sql_rows(rows, columns))
+    finally:
+        connection.close()
+    return len(rows)
+
+def upsert_orders(season, season_df, path=None):
+    """
+    Upsert the rows of one season file, line numbers the rows of an order
+    in file order. Rows of the season that are gone from it are deleted.
+    """
+    rows = season_df.copy()
+    rows['line'] = rows.groupby('id_order', sort=False).cumcount()
+    columns = [column for column in ORDER_COLUMNS if column in rows.columns]
+    connection = open_store(path)
+    try:
+        with connection:
+            connection.execute("DELETE FROM orders WHERE season = ?", [season])
+            upsert(connection, 'orders', ORDER_KEY, columns, sql_rows(rows, columns))
+    finally:
+        connection.close()
+    return len(rows)
+
+def upsert_phone_numbers(unique_df, path=None):
+    """
+    Upsert unique phone numbers with the order they were first found in.
+    A stored number keeps its order unless the row has an earlier date_order,
+    so runs over later files do not overwrite where it was first seen.
+    """
+    columns = [column for column in PHONE_COLUMNS if column in unique_df.columns]
+    first_seen = {column: f"CASE WHEN {PHONE_EARLIER} THEN excluded.{column} ELSE phone_numbers.{column} END"
+                  for column in PHONE_FIRST_SEEN}
+    connection = open_store(path)
+    try:
+        with connection:
+            upsert(connection, 'phone_numbers', PHONE_KEY, columns, sql_rows(unique_df, columns), first_seen)
+    finally:
+        connection.close()
+    return len(unique_df)
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the local fact store of the ETL outputs")
+    parser.add_argument('sql', help="SQL query over the insights, orders and phone_numbers tables")
+    parser.add_argument('--csv', type=Path, help="Export the result to this CSV instead of printing it")
+    parser.add_argument('--store', type=Path, help=f"Store file (default: {STORE_PATH})")
+    args = parser.parse_args()
+
+    connection = open_store(args.store)
+    try:
+        cursor = connection.execute(args.sql)
+        header = [column[0] for column in cursor.description or []]
+        if args.csv:
+            with open(args.csv, 'w', newline='') as f:
+                writer = csv.writer(f, lineterminator='\n')
+                writer.writerow(header)
+                writer.writerows(cursor)
+            print(f"Saved query result to: {args.csv}")
+        else:
+            writer = csv.writer(sys.stdout, lineterminator='\n')
+            writer.writerow(header)
+            writer.writerows(cursor)
+    finally:
+        connection.close()
+
+if __name__ == "__main__":
+    main()
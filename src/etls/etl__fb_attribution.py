@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Daily and cumulative cost per order (CPA) and return on ad spend (ROAS) per
+campaign, from the campaign_days.csv of every campaign written by
+etl__fb_day and the season TSVs written by etl__orders.
+
+Orders carry no campaign, so each order is attributed to the spend of the
+window days up to and including its order date, split across campaigns and
+days in proportion to spend. With --window 3 an order of 2024-12-10 is
+shared by the spend of 2024-12-08, 2024-12-09 and 2024-12-10. Revenue is the
+sum of price_to_pay of the order rows.
+
+python3 src/etls/etl__fb_attribution.py --window 7
+"""
+
+import argparse
+import glob
+import logging
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+STAGING_DIR = Path('/home/hylmarj/_scratch/staging-goldsport-analytics')
+# Written by etl__fb_day for every campaign, the campaign is the part between goldsport__fa_ and ___gsp
+CAMPAIGN_DAYS_GLOB = 'goldsport__fa_*___gsp_dataset___auto_full/method=auto_full/source=goldsport/campaign_days.csv'
+# Season files written by etl__orders
+ORDERS_GLOB = 'goldsport__orders___gsp_dataset___auto_full/method=auto_full/source=goldsport/orders_*.tsv'
+OUTPUT_DIR = 'goldsport__attribution___gsp_dataset___auto_full/method=auto_full/source=goldsport'
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def read_spend(staging_dir):
+    """Spend per campaign and day of every campaign_days.csv, None if there are none."""
+    frames = []
+    for path in sorted(glob.glob(str(staging_dir / CAMPAIGN_DAYS_GLOB))):
+        campaign = Path(path).parents[2].name[len('goldsport__fa_'):].rsplit('___gsp_dataset', 1)[0]
+        df = pd.read_csv(path, usecols=['date_start', 'spend'])
+        df.insert(0, 'campaign', campaign)
+        frames.append(df)
+    if not frames:
+        return None
+    spend = pd.concat(frames, ignore_index=True)
+    spend['date'] = pd.to_datetime(spend['date_start'])
+    return spend.groupby(['campaign', 'date'], as_index=False)['spend'].sum()
+
+def read_orders(staging_dir):
+    """Distinct orders and revenue per order date of every season file, None if there are none."""
+    paths = sorted(glob.glob(str(staging_dir / ORDERS_GLOB)))
+    if not paths:
+        return None
+    orders = pd.concat([pd.read_csv(path, sep='\t', usecols=['id_order', 'date_order', 'price_to_pay'])
+                        for path in paths], ignore_index=True)
+    orders['date'] = pd.to_datetime(orders['date_order'], errors='coerce', format='%Y-%m-%d')
+    invalid = orders['date'].isna().sum()
+    if invalid:
+        logging.warning(f"Skipping {invalid} order rows without a valid date_order")
+    orders = orders.dropna(subset=['date'])
+    return orders.groupby('date').agg(orders=('id_order', 'nunique'), revenue=('price_to_pay', 'sum'))
+
+def attribute(spend, orders, window):
+    """
+    spend with the orders and revenue attributed to each campaign and day,
+    and the orders and revenue left without spend in their window.
+    """
+    calendar = pd.date_range(min(spend['date'].min(), orders.index.min()),
+                             max(spend['date'].max(), orders.index.max()), freq='D')
+    # Campaign spend as a day x campaign matrix over the full calendar
+    daily = spend.pivot(index='date', columns='campaign', values='spend').reindex(calendar, fill_value=0).fillna(0)
+    daily_orders = orders.reindex(calendar, fill_value=0)
+
+    # Spend of all campaigns in the window ending on each order date
+    window_spend = daily.sum(axis=1).rolling(window, min_periods=1).sum().to_numpy()
+    covered = window_spend > 0
+    # Orders and revenue per unit of window spend, summed over the window days starting at each spend day
+    shares = {}
+    for column in ['orders', 'revenue']:
+        per_spend = np.divide(daily_orders[column].to_numpy(dtype=float), window_spend,
+                              out=np.zeros(len(calendar)), where=covered)
+        shares[column] = pd.Series(per_spend[::-1]).rolling(window, min_periods=1).sum().to_numpy()[::-1]
+
+    result = spend.copy()
+    position = calendar.get_indexer(result['date'])
+    result['orders'] = result['spend'].to_numpy() * shares['orders'][position]
+    result['revenue'] = result['spend'].to_numpy() * shares['revenue'][position]
+    unattributed = daily_orders[~covered].sum()
+    return result, unattributed
+
+def add_ratios(result):
+    """Daily and cumulative CPA and ROAS columns, empty where undefined."""
+    result = result.sort_values(['campaign', 'date'], kind='stable').reset_index(drop=True)
+    cumulative = result.groupby('campaign', sort=False)[['spend', 'orders', 'revenue']].cumsum()
+    for column in ['spend', 'orders', 'revenue']:
+        result[f'{column}_cumulative'] = cumulative[column]
+    for suffix in ['', '_cumulative']:
+        spend, orders, revenue = (result[f'{column}{suffix}'] for column in ['spend', 'orders', 'revenue'])
+        result[f'cpa{suffix}'] = (spend / orders).where(orders > 0)
+        result[f'roas{suffix}'] = (revenue / spend).where(spend > 0)
+    result['date'] = result['date'].dt.strftime('%Y-%m-%d')
+    return result.round({'orders': 3, 'orders_cumulative': 3, 'revenue': 2, 'revenue_cumulative': 2,
+                         'spend_cumulative': 2, 'cpa': 2, 'cpa_cumulative': 2, 'roas': 4, 'roas_cumulative': 4})
+
+def main():
+    parser = argparse.ArgumentParser(description="Spend to orders attribution per campaign and day")
+    parser.add_argument('--window', type=int, default=7,
+                        help="Days of spend an order is attributed to, its order date included (default: 7)")
+    parser.add_argument('--staging-dir', type=Path, default=STAGING_DIR,
+                        help=f"Directory with the campaign and orders outputs (default: {STAGING_DIR})")
+    args = parser.parse_args()
+    if args.window < 1:
+        parser.error("--window must be at least 1")
+
+    spend = read_spend(args.staging_dir)
+    if spend is None:
+        logging.error(f"No campaign_days.csv found in {args.staging_dir}")
+        sys.exit(1)
+    orders = read_orders(args.staging_dir)
+    if orders is None or orders.empty:
+        logging.error(f"No orders found in {args.staging_dir}")
+        sys.exit(1)
+    logging.info(f"Attributing {int(orders['orders'].sum())} orders over {orders.index.nunique()} days to "
+                 f"{len(spend)} campaign days of {spend['campaign'].nunique()} campaigns, window {args.window} days")
+
+    result, unattributed = attribute(spend, orders, args.window)
+    if unattributed['orders']:
+        logging.info(f"{int(unattributed['orders'])} orders ({unattributed['revenue']:.2f} revenue) "
+                     f"had no spend in their window")
+    result = add_ratios(result)
+
+    output_dir = args.staging_dir / OUTPUT_DIR
+    output_dir.mkdir(parents=True, exist_ok=True)
+    output_csv = output_dir / f'attribution_days_window_{args.window}.csv'
+    result.to_csv(output_csv, index=False)
+    logging.info(f"Successfully saved attribution data to: {output_csv}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Run etl__fb_day and etl__fb_to_date over every campaign of an insights root
+in one process pool, instead of one Python start-up per campaign and script.
+Outputs of each campaign go to the same paths as when running the scripts
+on its directory, a per-campaign summary is logged at the end.
+
+python3 src/etls/etl__fb_batch.py /home/hylmarj/_scratch/aps-goldsport-facebook --workers 4
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import etl__fb_day
+import etl__fb_to_date
+from common__insights import iso_date
+
+JOBS = {
+    'day': etl__fb_day.process_campaign,
+    'to_date': etl__fb_to_date.process_campaign,
+}
+
+def find_campaign_dirs(insights_root):
+    """campaign=<name>/type=insights directories of the insights root, sorted."""
+    campaign_dirs = []
+    with os.scandir(insights_root) as entries:
+        for entry in entries:
+            insights_dir = Path(entry.path) / 'type=insights'
+            if entry.name.startswith('campaign=') and insights_dir.is_dir():
+                campaign_dirs.append(insights_dir)
+    return sorted(campaign_dirs)
+
+def run_job(kind, insights_dir, since, until, full, store):
+    """One script over one campaign, returns its summary and the seconds taken."""
+    start = time.perf_counter()
+    try:
+        summary = JOBS[kind](insights_dir, 1, since, until, full, store)
+    except Exception as e:
+        logging.error(f"Error processing {kind} files of {insights_dir}: {str(e)}")
+        summary = None
+    return summary, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Insights ETLs over all campaigns of an insights root")
+    parser.add_argument('insights_root', type=Path, help="Directory holding the campaign=<name> directories")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="Processes running campaigns concurrently (default: CPU count)")
+    parser.add_argument('--only', choices=sorted(JOBS), help="Run only the day or the to_date ETL")
+    parser.add_argument('--since', type=iso_date,
+                        help="Only check date= directories from this date for new files (YYYY-MM-DD)")
+    parser.add_argument('--until', type=iso_date,
+                        help="Only check date= directories up to this date for new files (YYYY-MM-DD)")
+    parser.add_argument('--full', action='store_true',
+                        help="Parse every file within --since/--until again instead of only new or changed ones")
+    parser.add_argument('--no-store', action='store_true', help="Do not upsert the rows into the fact store")
+    args = parser.parse_args()
+
+    if not args.insights_root.is_dir():
+        logging.error(f"Directory does not exist: {args.insights_root}")
+        sys.exit(1)
+
+    campaign_dirs = find_campaign_dirs(args.insights_root)
+    if not campaign_dirs:
+        logging.error(f"No campaign=<name>/type=insights directories found in {args.insights_root}")
+        sys.exit(1)
+    kinds = [args.only] if args.only else list(JOBS)
+    logging.info(f"Processing {len(campaign_dirs)} campaigns with {args.workers} workers")
+
+    # All campaigns and both scripts share one pool, results are reported in campaign order
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max(1, args.workers)) as pool:
+        jobs = [(insights_dir, kind, pool.submit(run_job, kind, insights_dir, args.since, args.until, args.full,
+                                                   not args.no_store))
+                for insights_dir in campaign_dirs for kind in kinds]
+        results = [(insights_dir, kind, *job.result()) for insights_dir, kind, job in jobs]
+
+    logging.info(f"Campaign summary ({time.perf_counter() - start:.1f} s in total):")
+    failed = 0
+    for insights_dir, kind, summary, seconds in results:
+        campaign = insights_dir.parent.name.split('=', 1)[1]
+        if summary is None:
+            failed += 1
+            logging.info(f"  {campaign} {kind}: FAILED after {seconds:.1f} s")
+            continue
+        logging.info(f"  {campaign} {kind}: {summary['files']} files ({summary['failed']} failed), "
+                     f"{summary['campaign_rows']} campaign rows, {summary['ad_rows']} ad rows, {seconds:.1f} s")
+    if failed:
+        logging.error(f"{failed} of {len(results)} campaign runs failed")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,143 +1,112 @@
-import json
+import argparse
+import numpy as np
 import pandas as pd
 from pathlib import Path
 import sys
 from datetime import datetime
 import logging
 
+from common__insights import (INDEX_FILENAME, INSIGHT_COLUMNS, RecordAccumulator, VIDEO_METRICS, campaign_id,
+                              discover_files, get_output_directory, insight_record, iso_date, load_json,
+                              log_parse_summary, parse_changed_files)
+from common__store import upsert_insights
+
+# Ad rows have their video metrics last
+AD_COLUMNS = ['name', 'type', 'reach', 'impressions', 'spend', 'date_start', 'date_stop',
+              'result_type', 'results', *VIDEO_METRICS]
+
+# Wide action column counted as clicks for the click-through rate
+LINK_CLICKS = 'actions__link_click'
+# Rolling sums cover the day and the 6 calendar days before it
+ROLLING_WINDOW = '7D'
+ROLLING_METRICS = ['spend', 'impressions', 'results', 'link_clicks']
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def get_output_directory(input_path):
+def read_insights(file_path):
+    """Campaign and ads insights of a day file, None for files without data."""
+    data = load_json(file_path)
+
+    # Check if file has actual data
+    if not data.get('ads') or not data['ads'][0].get('insights'):
+        return None, None
+
+    campaign_insights = data['campaign']['insights'][0]
+    ads_insights = [ad['insights'][0] for ad in data['ads']]
+
+    return campaign_insights, ads_insights
+
+def campaign_record(insights):
+    """Record of the campaign-level metrics."""
+    return insight_record(insights, insights['campaign_name'], 'day_campaign',
+                          insights['date_start'], insights['date_stop'], insights['results'])
+
+def ad_records(insights_list):
+    """Records of the ad-level metrics."""
+    return [insight_record(insights, insights['ad_name'], 'day_ad',
+                           insights['date_start'], insights['date_stop'], insights['results'])
+            for insights in insights_list]
+
+def add_kpis(df):
     """
-    Transform input path to desired output path format.
-    
-    From: /home/hylmarj/aps-goldsport-facebook/_scratch/campaign=adult_ski_beginner__traffic__120215321990480063/type=insights
-    To: /home/hylmarj/_scratch/staging-goldsport-analytics/goldsport__fa_adult_ski_beginner__traffic__120215321990480063___gsp_dataset___auto_full/method=auto_full/source=goldsport
+    df with the derived KPI columns appended: CPM, CTR, frequency, cost per
+    result, video retention from p25 and rolling 7 day sums per name and
+    line, line numbering the ads sharing a name on a day in file order as in
+    the fact store. Ratios with a zero denominator are left empty, missing
+    link clicks count as 0.
     """
-    # Extract the campaign identifier from the input path
-    campaign_part = input_path.split('campaign=')[1].split('/')[0]
-    
-    # Construct new path components
-    base_dir = '/home/hylmarj/_scratch/staging-goldsport-analytics'
-    campaign_dir = f'goldsport__fa_{campaign_part}___gsp_dataset___auto_full'
-    method_dir = 'method=auto_full'
-    source_dir = 'source=goldsport'
-    
-    # Combine into final path
-    return Path(base_dir) / campaign_dir / method_dir / source_dir
+    impressions = df['impressions'].where(df['impressions'] > 0)
+    results = pd.to_numeric(df['results'], errors='coerce').fillna(0)
+    link_clicks = df[LINK_CLICKS].fillna(0) if LINK_CLICKS in df else pd.Series(0.0, index=df.index)
+    p25 = df['video_p25_watched_actions'].where(df['video_p25_watched_actions'] > 0)
+    kpis = pd.DataFrame({
+        'cpm': (df['spend'] / impressions * 1000).round(4),
+        'ctr': (link_clicks / impressions).round(6),
+        'frequency': (df['impressions'] / df['reach'].where(df['reach'] > 0)).round(4),
+        'cost_per_result': (df['spend'] / results.where(results > 0)).round(4),
+        **{f'video_retention_p{quartile}': (df[f'video_p{quartile}_watched_actions'] / p25).round(4)
+           for quartile in (50, 75, 100)},
+    }, index=df.index)
 
-def get_video_actions(actions, action_type):
-    """Extract video action values from the actions list."""
-    try:
-        if not actions:
-            return 0
-        for action in actions:
-            if action.get('action_type') == action_type:
-                return float(action.get('value', 0))
-        return 0
-    except (TypeError, ValueError):
-        return 0
-
-def find_day_files(insights_dir):
-    """Find daily insight files in the directory structure."""
-    day_files = []
-    for path in Path(insights_dir).rglob('*.json'):
-        try:
-            # Extract date from directory name
-            date_str = path.parent.name.split('=')[1]
-            if 'date__' in path.name and 'to_date__' not in path.name:
-                if date_str in path.name:
-                    day_files.append(path)
-        except (IndexError, ValueError) as e:
-            logging.warning(f"Skipping invalid directory name: {path.parent.name}")
-            continue
-    return sorted(day_files)
-
-def process_json_file(file_path):
-    """Process a single JSON file and extract relevant metrics."""
-    logging.info(f"Processing file: {file_path}")
+    # Time based windows per campaign or ad, rows are already sorted by date_start
+    metrics = pd.DataFrame({'name': df['name'], 'date_start': df['date_start'], 'spend': df['spend'],
+                            'impressions': df['impressions'], 'results': results, 'link_clicks': link_clicks})
+    metrics['line'] = metrics.groupby(['name', 'date_start'], sort=False, dropna=False).cumcount()
+    grouped = metrics.groupby(['name', 'line'], sort=False, dropna=False)
+    rolling = grouped.rolling(ROLLING_WINDOW, on='date_start')[ROLLING_METRICS].sum()
+    # Rolling sums come back group after group, in order of first appearance of the names
+    positions = np.argsort(grouped.ngroup().to_numpy(), kind='stable')
+    for column in ROLLING_METRICS:
+        values = np.empty(len(df))
+        values[positions] = rolling[column].to_numpy()
+        kpis[f'{column}_7d'] = np.round(values, 2)
+    return pd.concat([df, kpis], axis=1)
+
+def flatten_file(file_path):
+    """
+    Records of one day file as (campaign record, ad records, error), both
+    records None for files without data. The campaign row is kept when only
+    its ads fail.
+    """
+    campaign_insights, ads_insights = read_insights(file_path)
+    if not (campaign_insights and ads_insights):
+        return None, None, None
+    campaign = campaign_record(campaign_insights)
     try:
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-            
-        # Check if file has actual data
-        if not data.get('ads') or not data['ads'][0].get('insights'):
-            return None, None
-            
-        campaign_insights = data['campaign']['insights'][0]
-        ads_insights = [ad['insights'][0] for ad in data['ads']]
-        
-        return campaign_insights, ads_insights
+        return campaign, ad_records(ads_insights), None
     except Exception as e:
-        logging.error(f"Error processing file {file_path}: {str(e)}")
-        return None, None
+        return campaign, None, str(e)
 
-def create_campaign_df(insights):
-    """Create DataFrame for campaign-level metrics."""
-    return pd.DataFrame({
-        'name': insights['campaign_name'],
-        'type': 'day_campaign',
-        'reach': float(insights['reach']),
-        'impressions': float(insights['impressions']),
-        'spend': float(insights['spend']),
-        'video_p25_watched_actions': get_video_actions(insights.get('video_p25_watched_actions'), 'video_view'),
-        'video_p50_watched_actions': get_video_actions(insights.get('video_p50_watched_actions'), 'video_view'),
-        'video_p75_watched_actions': get_video_actions(insights.get('video_p75_watched_actions'), 'video_view'),
-        'video_p100_watched_actions': get_video_actions(insights.get('video_p100_watched_actions'), 'video_view'),
-        'date_start': insights['date_start'],
-        'date_stop': insights['date_stop'],
-        'result_type': insights['result_type'],
-        'results': insights['results']
-    }, index=[0])
-
-def create_ads_df(insights_list):
-    """Create DataFrame for ad-level metrics."""
-    ads_data = []
-    for insights in insights_list:
-        ad_data = {
-            'name': insights['ad_name'],
-            'type': 'day_ad',
-            'reach': float(insights['reach']),
-            'impressions': float(insights['impressions']),
-            'spend': float(insights['spend']),
-            'date_start': insights['date_start'],
-            'date_stop': insights['date_stop'],
-            'result_type': insights['result_type'],
-            'results': insights['results']
-        }
-        
-        video_metrics = [
-            'video_p25_watched_actions',
-            'video_p50_watched_actions', 
-            'video_p75_watched_actions',
-            'video_p100_watched_actions'
-        ]
-        
-        for metric in video_metrics:
-            actions = insights.get(metric, [])
-            value = 0
-            if actions:
-                for action in actions:
-                    if action.get('action_type') == 'video_view':
-                        try:
-                            value = float(action.get('value', 0))
-                        except (ValueError, TypeError):
-                            value = 0
-                        break
-            ad_data[metric] = value
-            
-        ads_data.append(ad_data)
-    return pd.DataFrame(ads_data)
-
-def main():
-    if len(sys.argv) != 2:
-        logging.error("Usage: python3 analyze_day.py <insights_directory>")
-        sys.exit(1)
-    
-    insights_dir = Path(sys.argv[1])
+def process_campaign(insights_dir, workers=1, since=None, until=None, full=False, store=True):
+    """
+    Write the daily CSVs of one campaign=<name>/type=insights directory,
+    returns the numbers of files and rows written or None on failure.
+    Rows are also upserted into the fact store unless store is False.
+    """
+    insights_dir = Path(insights_dir)
     if not insights_dir.exists():
         logging.error(f"Directory does not exist: {insights_dir}")
-        sys.exit(1)
+        return None
     
     logging.info(f"Processing directory: {insights_dir}")
     
@@ -146,40 +115,52 @@ def main():
     output_dir.mkdir(parents=True, exist_ok=True)
     logging.info(f"Created output directory: {output_dir}")
     
-    campaign_dfs = []
-    ads_dfs = []
+    # Rows of all files are accumulated and each frame is built once
+    campaign_records = RecordAccumulator(INSIGHT_COLUMNS)
+    ads_records = RecordAccumulator(AD_COLUMNS)
     
-    # Process each day file
-    day_files = find_day_files(insights_dir)
+    # Day files of every date= directory, listings of unchanged directories are cached
+    day_files, _ = discover_files(insights_dir, since, until, output_dir / INDEX_FILENAME)
     if not day_files:
         logging.error("No valid day files found in the directory structure")
-        sys.exit(1)
-        
-    for file_path in day_files:
-        campaign_insights, ads_insights = process_json_file(file_path)
-        if campaign_insights and ads_insights:
-            try:
-                campaign_dfs.append(create_campaign_df(campaign_insights))
-                ads_dfs.append(create_ads_df(ads_insights))
-            except Exception as e:
-                logging.error(f"Error creating dataframes for {file_path}: {str(e)}")
-                continue
+        return None
+
+    # New and changed files are parsed in parallel, results are merged in file order
+    skipped, errors = 0, []
+    results = parse_changed_files(day_files, flatten_file, workers, output_dir, 'day', full, since, until)
+    for file_path, (campaign, ads, error) in results.items():
+        logging.info(f"Processing file: {file_path}")
+        if campaign is not None:
+            campaign_records.append(campaign)
+        if ads:
+            ads_records.extend(ads)
+        if error:
+            logging.error(f"Error processing file {file_path}: {error}")
+            errors.append((file_path, error))
+        elif campaign is None:
+            skipped += 1
+    log_parse_summary(len(results), skipped, errors)
     
-    if not campaign_dfs:
+    if not campaign_records:
         logging.error("No data was successfully processed")
-        sys.exit(1)
+        return None
     
     # Combine and save results
     try:
-        campaign_df = pd.concat(campaign_dfs, ignore_index=True)
-        ads_df = pd.concat(ads_dfs, ignore_index=True)
+        campaign_df = campaign_records.to_frame()
+        ads_df = ads_records.to_frame()
         
         # Sort by date
         campaign_df['date_start'] = pd.to_datetime(campaign_df['date_start'])
         ads_df['date_start'] = pd.to_datetime(ads_df['date_start'])
         
-        campaign_df = campaign_df.sort_values('date_start')
-        ads_df = ads_df.sort_values('date_start')
+        # Stable, ads of a day keep their file order for the line of add_kpis and the store
+        campaign_df = campaign_df.sort_values('date_start', kind='stable')
+        ads_df = ads_df.sort_values('date_start', kind='stable')
+
+        # Derived KPIs go after the metric and action columns
+        campaign_df = add_kpis(campaign_df)
+        ads_df = add_kpis(ads_df)
         
         # Save to CSV
         campaign_csv = output_dir / 'campaign_days.csv'
@@ -190,9 +171,33 @@ def main():
         
         logging.info(f"Successfully saved campaign data to: {campaign_csv}")
         logging.info(f"Successfully saved ads data to: {ads_csv}")
+
+        if store:
+            rows = upsert_insights(campaign_id(insights_dir), 'day', campaign_df, ads_df)
+            logging.info(f"Upserted {rows} rows into the fact store")
+        return {'files': len(day_files), 'failed': len(errors),
+                'campaign_rows': len(campaign_df), 'ad_rows': len(ads_df)}
         
     except Exception as e:
         logging.error(f"Error saving results: {str(e)}")
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Daily campaign and ad metrics from Facebook insights files")
+    parser.add_argument('insights_dir', type=Path, help="Insights directory, campaign=<name>/type=insights")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Processes parsing the JSON files (default: 1)")
+    parser.add_argument('--since', type=iso_date,
+                        help="Only check date= directories from this date for new files (YYYY-MM-DD)")
+    parser.add_argument('--until', type=iso_date,
+                        help="Only check date= directories up to this date for new files (YYYY-MM-DD)")
+    parser.add_argument('--full', action='store_true',
+                        help="Parse every file within --since/--until again instead of only new or changed ones")
+    parser.add_argument('--no-store', action='store_true', help="Do not upsert the rows into the fact store")
+    args = parser.parse_args()
+
+    if process_campaign(args.insights_dir, args.workers, args.since, args.until, args.full,
+                        not args.no_store) is None:
         sys.exit(1)
 
 if __name__ == "__main__":
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Reconcile the to_date snapshots of etl__fb_to_date with the daily rows of
+etl__fb_day for every campaign of the staging directory.
+
+The daily spend, impressions and results of each campaign and ad name are
+summed over the range of every to_date row (date_start to date_stop) and
+compared with it, ads sharing a name are summed together. The drift of a snapshot is carried by every later one, so a day is
+flagged only when the drift changes from the previous snapshot, or when
+daily rows of its range are missing. Only the flagged days need to be
+fetched again. Each campaign gets a reconciliation.csv next to its CSVs,
+the flagged days of all campaigns go to refetch_days.csv.
+
+python3 src/etls/etl__fb_reconcile.py --tolerance 0.01
+"""
+
+import argparse
+import glob
+import logging
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+STAGING_DIR = Path('/home/hylmarj/_scratch/staging-goldsport-analytics')
+# Output directories of etl__fb_day and etl__fb_to_date, one per campaign
+CAMPAIGN_DIRS_GLOB = 'goldsport__fa_*___gsp_dataset___auto_full/method=auto_full/source=goldsport'
+OUTPUT_DIR = 'goldsport__reconciliation___gsp_dataset___auto_full/method=auto_full/source=goldsport'
+
+# Metrics that add up over days, reach does not
+METRICS = ['spend', 'impressions', 'results']
+# Differences up to this are rounding of the CSV values
+ABS_TOLERANCE = 0.01
+LEVELS = {'campaign': ('campaign_days.csv', 'campaign_to_date.csv'), 'ad': ('ads_days.csv', 'ads_to_date.csv')}
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def read_rows(path, date_columns):
+    """name, dates and METRICS of an insights CSV with numeric results."""
+    df = pd.read_csv(path, usecols=['name', *date_columns, *METRICS])
+    df['results'] = pd.to_numeric(df['results'], errors='coerce')
+    for column in date_columns:
+        df[column] = pd.to_datetime(df[column])
+    return df
+
+def cumulative_days(daily):
+    """Running sums of METRICS and of the number of days per name, one row per name and day."""
+    daily = daily.groupby(['name', 'date_start'], as_index=False)[METRICS].sum()
+    daily['days'] = 1
+    sums = daily.groupby('name', sort=False)[[*METRICS, 'days']].cumsum()
+    return pd.concat([daily[['name', 'date_start']], sums], axis=1).sort_values('date_start', kind='stable')
+
+def sums_until(snapshots, cumulative, column):
+    """Running sums of each snapshot name at the last day on or before column, 0 before the first day."""
+    left = snapshots[['row', 'name', column]].sort_values(column, kind='stable')
+    merged = pd.merge_asof(left, cumulative, left_on=column, right_on='date_start', by='name',
+                           direction='backward')
+    return merged.set_index('row')[[*METRICS, 'days']].reindex(snapshots['row']).fillna(0).to_numpy()
+
+def reconcile(daily, snapshots, tolerance):
+    """
+    Snapshots with the summed daily METRICS, their drift and whether the
+    snapshot day drifted from the previous snapshot or lacks daily rows.
+    Ads sharing a name are summed on both sides, one row per name and range.
+    """
+    snapshots = (snapshots.groupby(['name', 'date_start', 'date_stop'], as_index=False)[METRICS].sum()
+                 .sort_values(['name', 'date_stop'], kind='stable').reset_index(drop=True))
+    snapshots['row'] = snapshots.index
+    snapshots['day_before_start'] = snapshots['date_start'] - pd.Timedelta(days=1)
+    cumulative = cumulative_days(daily)
+    # Daily sums over the range of each snapshot, as the difference of two running sums
+    summed = (sums_until(snapshots, cumulative, 'date_stop')
+              - sums_until(snapshots, cumulative, 'day_before_start'))
+
+    result = snapshots[['name', 'date_start', 'date_stop']].copy()
+    by_name = snapshots.groupby('name', sort=False)
+    drifted = np.zeros(len(snapshots), dtype=bool)
+    for i, metric in enumerate(METRICS):
+        result[f'{metric}_to_date'] = snapshots[metric]
+        result[f'{metric}_daily'] = summed[:, i].round(2)
+        result[f'{metric}_drift'] = (snapshots[metric] - summed[:, i]).round(2)
+        # Change of drift and of the snapshot value since the previous snapshot of the name
+        change = result.groupby('name', sort=False)[f'{metric}_drift'].diff().fillna(result[f'{metric}_drift'])
+        increment = by_name[metric].diff().fillna(snapshots[metric]).abs()
+        drifted |= (change.abs() > np.maximum(ABS_TOLERANCE, tolerance * increment)).to_numpy()
+
+    days = (snapshots['date_stop'] - snapshots['date_start']).dt.days + 1
+    result['days_missing'] = (days - summed[:, len(METRICS)]).astype(int)
+    missing = result.groupby('name', sort=False)['days_missing'].diff().fillna(result['days_missing']) > 0
+    result['drifted'] = drifted
+    result['missing_days'] = missing.to_numpy()
+    return result
+
+def refetch_days(results):
+    """Days to fetch again with the number of drifted and incomplete rows of each."""
+    flagged = results[results['drifted'] | results['missing_days']]
+    return (flagged.groupby('date_stop')
+            .agg(drifted_rows=('drifted', 'sum'), missing_day_rows=('missing_days', 'sum'))
+            .reset_index().rename(columns={'date_stop': 'date'}))
+
+def reconcile_campaign(campaign_dir, tolerance):
+    """Reconciliation of both levels of one campaign output directory, None if a CSV is missing."""
+    frames = []
+    for level, (day_csv, to_date_csv) in LEVELS.items():
+        if not (campaign_dir / day_csv).exists() or not (campaign_dir / to_date_csv).exists():
+            return None
+        daily = read_rows(campaign_dir / day_csv, ['date_start'])
+        snapshots = read_rows(campaign_dir / to_date_csv, ['date_start', 'date_stop'])
+        result = reconcile(daily, snapshots, tolerance)
+        result.insert(0, 'level', level)
+        frames.append(result)
+    return pd.concat(frames, ignore_index=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconcile to_date insights with the summed daily insights")
+    parser.add_argument('--tolerance', type=float, default=0.01,
+                        help="Relative change of drift accepted per snapshot (default: 0.01)")
+    parser.add_argument('--staging-dir', type=Path, default=STAGING_DIR,
+                        help=f"Directory with the campaign outputs (default: {STAGING_DIR})")
+    args = parser.parse_args()
+
+    campaign_dirs = sorted(Path(path) for path in glob.glob(str(args.staging_dir / CAMPAIGN_DIRS_GLOB)))
+    if not campaign_dirs:
+        logging.error(f"No campaign output directories found in {args.staging_dir}")
+        sys.exit(1)
+
+    refetch = []
+    for campaign_dir in campaign_dirs:
+        campaign = campaign_dir.parents[1].name[len('goldsport__fa_'):].rsplit('___gsp_dataset', 1)[0]
+        results = reconcile_campaign(campaign_dir, args.tolerance)
+        if results is None:
+            logging.warning(f"Skipping {campaign}: day or to_date CSVs missing")
+            continue
+        results.to_csv(campaign_dir / 'reconciliation.csv', index=False, date_format='%Y-%m-%d')
+        days = refetch_days(results)
+        days.insert(0, 'campaign', campaign)
+        refetch.append(days)
+        logging.info(f"{campaign}: {int(results['drifted'].sum())} drifted and "
+                     f"{int(results['missing_days'].sum())} incomplete of {len(results)} snapshots, "
+                     f"{len(days)} days to re-fetch")
+
+    if not refetch:
+        logging.error("No campaign had both day and to_date CSVs")
+        sys.exit(1)
+    output_dir = args.staging_dir / OUTPUT_DIR
+    output_dir.mkdir(parents=True, exist_ok=True)
+    output_csv = output_dir / 'refetch_days.csv'
+    refetch = pd.concat(refetch, ignore_index=True)
+    refetch.to_csv(output_csv, index=False, date_format='%Y-%m-%d')
+    logging.info(f"Saved {len(refetch)} campaign days to re-fetch to: {output_csv}")
+
+if __name__ == "__main__":
+    main()
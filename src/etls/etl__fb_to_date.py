@@ -1,168 +1,114 @@
-import json
+import argparse
 import pandas as pd
 from pathlib import Path
 import sys
 from datetime import datetime
 import logging
 
+from common__insights import (INDEX_FILENAME, INSIGHT_COLUMNS, RecordAccumulator, campaign_id,
+                              discover_files, get_output_directory, insight_record, iso_date, load_json,
+                              log_parse_summary, parse_changed_files)
+from common__store import upsert_insights
+
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def get_output_directory(input_path):
+def read_insights(file_path):
     """
-    Transform input path to desired output path format.
-    
-    From: /home/hylmarj/aps-goldsport-facebook/_scratch/campaign=adult_ski_beginner__traffic__120215321990480063/type=insights
-    To: /home/hylmarj/_scratch/staging-goldsport-analytics/goldsport__fa_adult_ski_beginner__traffic__120215321990480063___gsp_dataset___auto_full/method=auto_full/source=goldsport
+    Campaign and ads insights of a to_date file with its reporting period,
+    None for files without data.
     """
-    # Extract the campaign identifier from the input path
-    campaign_part = input_path.split('campaign=')[1].split('/')[0]
-    
-    # Construct new path components
-    base_dir = '/home/hylmarj/_scratch/staging-goldsport-analytics'
-    campaign_dir = f'goldsport__fa_{campaign_part}___gsp_dataset___auto_full'
-    method_dir = 'method=auto_full'
-    source_dir = 'source=goldsport'
-    
-    # Combine into final path
-    return Path(base_dir) / campaign_dir / method_dir / source_dir
+    data = load_json(file_path)
 
-def get_video_actions(actions, action_type):
-    """Extract video action values from the actions list."""
-    try:
-        if not actions:
-            return 0
-        for action in actions:
-            if action.get('action_type') == action_type:
-                return float(action.get('value', 0))
-        return 0
-    except (TypeError, ValueError):
-        return 0
+    if not data.get('ads') or not data['ads'][0].get('insights'):
+        return None
 
-def process_json_file(file_path):
-    """Process a single JSON file and extract relevant metrics."""
-    logging.info(f"Processing file: {file_path}")
-    try:
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-            
-        if not data.get('ads') or not data['ads'][0].get('insights'):
-            return None, None
-            
-        reporting_period = data['metadata']['reportingPeriod']
-        campaign_insights = data['campaign']['insights'][0]
-        ads_insights = [ad['insights'][0] for ad in data['ads']]
-        
-        return campaign_insights, ads_insights, reporting_period['startDate'], reporting_period['endDate']
-    except Exception as e:
-        logging.error(f"Error processing file {file_path}: {str(e)}")
-        return None, None, None, None
+    reporting_period = data['metadata']['reportingPeriod']
+    campaign_insights = data['campaign']['insights'][0]
+    ads_insights = [ad['insights'][0] for ad in data['ads']]
 
-def create_campaign_df(insights, start_date, end_date):
-    """Create DataFrame for campaign-level metrics."""
-    return pd.DataFrame({
-        'name': insights['campaign_name'],
-        'type': 'to_date_campaign',
-        'reach': float(insights['reach']),
-        'impressions': float(insights['impressions']),
-        'spend': float(insights['spend']),
-        'video_p25_watched_actions': get_video_actions(insights.get('video_p25_watched_actions'), 'video_view'),
-        'video_p50_watched_actions': get_video_actions(insights.get('video_p50_watched_actions'), 'video_view'),
-        'video_p75_watched_actions': get_video_actions(insights.get('video_p75_watched_actions'), 'video_view'),
-        'video_p100_watched_actions': get_video_actions(insights.get('video_p100_watched_actions'), 'video_view'),
-        'date_start': start_date,
-        'date_stop': end_date,
-        'result_type': insights['result_type'],
-        'results': float(insights.get('results', 0))
-    }, index=[0])
+    return campaign_insights, ads_insights, reporting_period['startDate'], reporting_period['endDate']
 
-def create_ads_df(insights_list, start_date, end_date):
-    """Create DataFrame for ad-level metrics."""
-    ads_data = []
-    for insights in insights_list:
-        video_metrics = {
-            metric: get_video_actions(insights.get(metric), 'video_view')
-            for metric in [
-                'video_p25_watched_actions',
-                'video_p50_watched_actions',
-                'video_p75_watched_actions',
-                'video_p100_watched_actions'
-            ]
-        }
-        
-        ads_data.append({
-            'name': insights['ad_name'],
-            'type': 'to_date_ad',
-            'reach': float(insights['reach']),
-            'impressions': float(insights['impressions']),
-            'spend': float(insights['spend']),
-            **video_metrics,
-            'date_start': start_date,
-            'date_stop': end_date,
-            'result_type': insights['result_type'],
-            'results': float(insights.get('results', 0))
-        })
-    return pd.DataFrame(ads_data)
+def campaign_record(insights, start_date, end_date):
+    """Record of the campaign-level metrics."""
+    return insight_record(insights, insights['campaign_name'], 'to_date_campaign',
+                          start_date, end_date, float(insights.get('results', 0)))
 
-def find_to_date_files(insights_dir):
-    """Find all to_date files in the directory structure."""
-    to_date_files = []
-    for path in Path(insights_dir).rglob('*.json'):
-        try:
-            if 'to_date__' in path.name:
-                date_str = path.parent.name.split('=')[1]
-                if date_str in path.name:
-                    to_date_files.append(path)
-        except (IndexError, ValueError) as e:
-            logging.warning(f"Skipping invalid directory name: {path.parent.name}")
-            continue
-    return sorted(to_date_files)
+def ad_records(insights_list, start_date, end_date):
+    """Records of the ad-level metrics."""
+    return [insight_record(insights, insights['ad_name'], 'to_date_ad',
+                           start_date, end_date, float(insights.get('results', 0)))
+            for insights in insights_list]
 
-def main():
-    if len(sys.argv) != 2:
-        logging.error("Usage: python3 analyze_to_date.py <insights_directory>")
-        sys.exit(1)
-    
-    insights_dir = Path(sys.argv[1])
+def flatten_file(file_path):
+    """
+    Records of one to_date file as (campaign record, ad records, error), both
+    records None for files without data. The campaign row is kept when only
+    its ads fail.
+    """
+    insights = read_insights(file_path)
+    if insights is None:
+        return None, None, None
+    campaign_insights, ads_insights, start_date, end_date = insights
+    campaign = campaign_record(campaign_insights, start_date, end_date)
+    try:
+        return campaign, ad_records(ads_insights, start_date, end_date), None
+    except Exception as e:
+        return campaign, None, str(e)
+
+def process_campaign(insights_dir, workers=1, since=None, until=None, full=False, store=True):
+    """
+    Write the cumulative CSVs of one campaign=<name>/type=insights directory,
+    returns the numbers of files and rows written or None on failure.
+    Rows are also upserted into the fact store unless store is False.
+    """
+    insights_dir = Path(insights_dir)
     if not insights_dir.exists():
         logging.error(f"Directory does not exist: {insights_dir}")
-        sys.exit(1)
+        return None
     
     logging.info(f"Processing directory: {insights_dir}")
     
-    # Find all to_date files
-    to_date_files = find_to_date_files(insights_dir)
+    # To_date files of every date= directory, listings of unchanged directories are cached
+    output_dir = get_output_directory(str(insights_dir))
+    _, to_date_files = discover_files(insights_dir, since, until, output_dir / INDEX_FILENAME)
     
     if not to_date_files:
         logging.error("No valid to_date files found in the directory structure")
-        sys.exit(1)
+        return None
     
     # Create output directory
-    output_dir = get_output_directory(str(insights_dir))
     output_dir.mkdir(parents=True, exist_ok=True)
     logging.info(f"Created output directory: {output_dir}")
     
-    campaign_dfs = []
-    ads_dfs = []
+    # Rows of all files are accumulated and each frame is built once
+    campaign_records = RecordAccumulator(INSIGHT_COLUMNS)
+    ads_records = RecordAccumulator(INSIGHT_COLUMNS)
     
-    # Process each to_date file
-    for file_path in to_date_files:
-        try:
-            campaign_insights, ads_insights, start_date, end_date = process_json_file(file_path)
-            campaign_dfs.append(create_campaign_df(campaign_insights, start_date, end_date))
-            ads_dfs.append(create_ads_df(ads_insights, start_date, end_date))
-        except Exception as e:
-            logging.error(f"Error processing file {file_path}: {str(e)}")
-            continue
+    # New and changed files are parsed in parallel, results are merged in file order
+    skipped, errors = 0, []
+    results = parse_changed_files(to_date_files, flatten_file, workers, output_dir, 'to_date', full, since, until)
+    for file_path, (campaign, ads, error) in results.items():
+        logging.info(f"Processing file: {file_path}")
+        if campaign is not None:
+            campaign_records.append(campaign)
+        if ads:
+            ads_records.extend(ads)
+        if error:
+            logging.error(f"Error processing file {file_path}: {error}")
+            errors.append((file_path, error))
+        elif campaign is None:
+            skipped += 1
+    log_parse_summary(len(results), skipped, errors)
     
-    if not campaign_dfs:
+    if not campaign_records:
         logging.error("No data was successfully processed")
-        sys.exit(1)
+        return None
     
     # Combine and save results
     try:
-        campaign_df = pd.concat(campaign_dfs, ignore_index=True)
-        ads_df = pd.concat(ads_dfs, ignore_index=True)
+        campaign_df = campaign_records.to_frame()
+        ads_df = ads_records.to_frame()
         
         # Sort by end date (date_stop)
         campaign_df['date_stop'] = pd.to_datetime(campaign_df['date_stop'])
@@ -180,9 +126,33 @@ def main():
         
         logging.info(f"Successfully saved campaign to-date data to: {campaign_csv}")
         logging.info(f"Successfully saved ads to-date data to: {ads_csv}")
+
+        if store:
+            rows = upsert_insights(campaign_id(insights_dir), 'to_date', campaign_df, ads_df)
+            logging.info(f"Upserted {rows} rows into the fact store")
+        return {'files': len(to_date_files), 'failed': len(errors),
+                'campaign_rows': len(campaign_df), 'ad_rows': len(ads_df)}
         
     except Exception as e:
         logging.error(f"Error saving results: {str(e)}")
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Cumulative campaign and ad metrics from Facebook insights files")
+    parser.add_argument('insights_dir', type=Path, help="Insights directory, campaign=<name>/type=insights")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Processes parsing the JSON files (default: 1)")
+    parser.add_argument('--since', type=iso_date,
+                        help="Only check date= directories from this date for new files (YYYY-MM-DD)")
+    parser.add_argument('--until', type=iso_date,
+                        help="Only check date= directories up to this date for new files (YYYY-MM-DD)")
+    parser.add_argument('--full', action='store_true',
+                        help="Parse every file within --since/--until again instead of only new or changed ones")
+    parser.add_argument('--no-store', action='store_true', help="Do not upsert the rows into the fact store")
+    args = parser.parse_args()
+
+    if process_campaign(args.insights_dir, args.workers, args.since, args.until, args.full,
+                        not args.no_store) is None:
         sys.exit(1)
 
 if __name__ == "__main__":
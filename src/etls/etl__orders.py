@@ -1,7 +1,46 @@
 import pandas as pd
+import argparse
+import contextlib
 import glob
+import hashlib
+import io
+import json
 import os
-from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from common__dtypes import compact_frame
+from common__store import upsert_orders
+
+INPUT_PATH = "/home/hylmarj/_scratch/staging-goldsport-analytics/goldsport__orders___gsp_dataset___hand_increment/method=hand_increment/source=goldsport"
+OUTPUT_PATH = "/home/hylmarj/_scratch/staging-goldsport-analytics/goldsport__orders___gsp_dataset___auto_full/method=auto_full/source=goldsport"
+
+# Manifest of the inputs of the last run and their seasons, next to the season files
+MANIFEST_FILENAME = "orders_manifest.json"
+# Validated input files, pickled with their dtypes and keyed by content hash
+CACHE_DIRNAME = ".orders_cache"
+# Bump when validate_and_fix_dataframe changes, cached inputs are then re-read
+MANIFEST_VERSION = 3
+
+# Lesson timestamps are local ski school times, always with this fixed offset
+LESSON_OFFSET = '+01:00'
+LESSON_TIMEZONE = timezone(timedelta(hours=1))
+
+# Column types of the Parquet season files, dates and timestamps are parsed separately
+PARQUET_TYPES = {
+    'id_order': 'int64',
+    'participants': 'int64',
+    'age_participant': 'float64',
+    'price_discount_percent': 'float64',
+    'price_without_vat': 'float64',
+    'price_to_pay': 'float64',
+    'season': 'category',
+    'level': 'category',
+    'language': 'category',
+    'location_meeting': 'category',
+    'price_currency': 'category',
+}
+PARQUET_DATE_COLUMNS = ['date_order', 'date_lesson']
 
 def get_season_range(season_str):
     """
@@ -15,6 +54,56 @@ def get_season_range(season_str):
     except:
         return None
 
+def string_mask(column):
+    """
+    Boolean mask of the values of column that are strings, numeric looking
+    ones included as read_csv leaves them in text columns.
+    """
+    if not (pd.api.types.is_object_dtype(column) or pd.api.types.is_string_dtype(column)):
+        return pd.Series(False, index=column.index)
+    try:
+        # The str accessor gives NaN for values that are not strings
+        return column.str.len().notna()
+    except AttributeError:
+        # Object columns without any string
+        return pd.Series(False, index=column.index)
+
+def parse_lesson_timestamps(column):
+    """
+    Parses lesson timestamps into tz-aware datetimes, once per distinct value
+    as lessons start on a few fixed slots. Values without offset are lesson
+    local times. Returns the parsed column, the malformed values and the
+    number of rows holding them.
+    """
+    codes, uniques = pd.factorize(column)
+    text = pd.Series(uniques, dtype=object).astype(str).str.replace(r'\s+', ' ', regex=True).str.strip()
+    # Offsets are written with a space before them
+    text = text.str.replace(r' ?([+-]\d{2}:\d{2})$', r'\1', regex=True)
+    naive = ~text.str.contains(r'(?:[+-]\d{2}:\d{2}|Z)$', regex=True)
+    text = text.where(~naive, text + LESSON_OFFSET)
+    parsed = pd.to_datetime(text, errors='coerce', utc=True, format='ISO8601').dt.tz_convert(LESSON_TIMEZONE)
+
+    unparsed = parsed.isna()
+    malformed = pd.Series(uniques, dtype=object)[unparsed].tolist()
+    malformed_rows = int(pd.Series(codes).isin(unparsed[unparsed].index).sum())
+    parsed = pd.Series(parsed.array.take(codes, allow_fill=True), index=column.index, name=column.name)
+    return parsed, malformed, malformed_rows
+
+def format_lesson_timestamps(column):
+    """
+    Lesson timestamps as text in the season file format, missing ones as None.
+    Every timestamp is written as YYYY-MM-DDTHH:MM:SS +01:00, so valid input
+    text is normalized: a space instead of T, missing seconds, spacing around
+    the offset and other offsets (converted to +01:00) do not survive.
+    """
+    codes, uniques = pd.factorize(column)
+    formatted = pd.Series(None, index=column.index, dtype=object)
+    if len(uniques):
+        text = (uniques.strftime('%Y-%m-%dT%H:%M:%S') + f' {LESSON_OFFSET}').to_numpy(dtype=object)
+        present = codes >= 0
+        formatted[present] = text[codes[present]]
+    return formatted
+
 def validate_and_fix_dataframe(df, filename):
     """
     Validates and fixes data quality issues in the DataFrame.
@@ -31,25 +120,12 @@ def validate_and_fix_dataframe(df, filename):
     if not pd.to_numeric(df['id_order'], errors='coerce').notna().all():
         print(f"\nDetected non-numeric id_order in {filename}, fixing...")
         
-        # Get correct data by looking at patterns
-        correct_data = []
-        for _, row in df.iterrows():
-            fixed_row = row.copy()
-            
-            # Fix common data shift issues
-            if isinstance(row['id_order'], str) and isinstance(row['date_order'], str):
-                if row['date_order'].startswith('20'):  # Looks like a date
-                    # Shift data back to correct columns
-                    fixed_row['id_order'] = None  # Will be filled later
-                    fixed_row['date_order'] = row['date_order']
-                    fixed_row['contact_sales'] = row['contact_sales']
-                    fixed_row['location_meeting'] = row['location_meeting']
-                    fixed_row['season'] = row['season']
-                    # ... rest of the columns stay as is
-            
-            correct_data.append(fixed_row)
-        
-        df = pd.DataFrame(correct_data)
+        # Fix common data shift issues: text id_order with a date in date_order.
+        # date_order onwards is already in the right columns, only the id is dropped
+        shifted = string_mask(df['id_order']) & string_mask(df['date_order']) \
+                  & df['date_order'].astype(str).str.startswith('20')
+        df['id_order'] = df['id_order'].astype(object).where(~shifted, None)  # Will be filled later
+        print(f"Shifted rows: {int(shifted.sum())}")
         
         # Clean up season column - remove invalid seasons
         valid_seasons = ['19/20', '20/21', '21/22', '22/23', '23/24', '24/25']
@@ -58,18 +134,23 @@ def validate_and_fix_dataframe(df, filename):
         # Generate sequential IDs for rows without valid id_order
         if df.shape[0] > 0:
             max_existing_id = 3000  # Starting point for new IDs
-            df.loc[df['id_order'].isna(), 'id_order'] = range(max_existing_id, max_existing_id + df['id_order'].isna().sum())
+            missing_ids = df['id_order'].isna()
+            df.loc[missing_ids, 'id_order'] = range(max_existing_id, max_existing_id + missing_ids.sum())
+            print(f"Synthesized IDs: {int(missing_ids.sum())} (from {max_existing_id})")
 
-    # Fix timestamp columns with more robust regex
+    # Parse timestamp columns into tz-aware datetimes, malformed values become NaT
     time_columns = ['timestamp_start_lesson', 'timestamp_end_lesson']
     for col in time_columns:
         if col in df.columns:
-            # Add space between timezone and time if missing
-            df[col] = df[col].str.replace(r'(?<=\+01:00)(?=\d)', ' ', regex=True)
-            # Remove any accidental double spaces
-            df[col] = df[col].str.replace(r'\s+', ' ', regex=True)
-            # Ensure consistent timezone format
-            df[col] = df[col].str.replace(r'(?<!\s)\+01:00', ' +01:00', regex=True)
+            df[col], malformed, malformed_rows = parse_lesson_timestamps(df[col])
+            if malformed:
+                print(f"Malformed {col} in {filename}: {malformed_rows} rows, "
+                      f"{len(malformed)} distinct values, e.g. {malformed[:3]}")
+
+    # Lesson length and local lesson day derived from the timestamps
+    if set(time_columns) <= set(df.columns):
+        df['duration_lesson_minutes'] = (df['timestamp_end_lesson'] - df['timestamp_start_lesson']).dt.total_seconds() / 60
+        df['date_start_lesson'] = df['timestamp_start_lesson'].dt.tz_localize(None).dt.normalize()
 
     # Ensure consistent price formatting - remove thousand separators before calculations
     price_columns = ['price_without_vat', 'price_to_pay']
@@ -94,61 +175,243 @@ def validate_and_fix_dataframe(df, filename):
 
     return df
 
+def detect_encoding(data):
+    """
+    Encoding of the file content, from a single decode pass.
+    """
+    try:
+        data.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError:
+        # Every byte sequence is valid latin1, so cp1252 is never needed
+        return 'latin1'
+
 def read_tsv_file(file):
     """
     Reads TSV file with proper error handling and encoding detection.
     """
     try:
-        # Try reading with different encodings
-        for encoding in ['utf-8', 'latin1', 'cp1252']:
-            try:
-                df = pd.read_csv(file, sep='\t', encoding=encoding)
-                return df
-            except UnicodeDecodeError:
-                continue
-            
-        raise ValueError(f"Could not read file with any encoding")
+        with open(file, 'rb') as f:
+            data = f.read()
+        encoding = detect_encoding(data)
+        return pd.read_csv(io.BytesIO(data), sep='\t', encoding=encoding)
         
     except Exception as e:
         print(f"Error reading {file}: {str(e)}")
         return None
 
+def load_file(file):
+    """
+    Reads and validates one TSV file, returns the DataFrame (or None) and
+    everything printed meanwhile, so output of parallel loads stays in order.
+    """
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        df = read_tsv_file(file)
+        if df is None:
+            pass
+        elif df.empty:
+            print(f"Warning: Empty DataFrame from {file}")
+            df = None
+        else:
+            # Add validation step
+            df = validate_and_fix_dataframe(df, file)
+            if df is None:
+                print(f"Error: Could not fix data format in {file}")
+    return df, output.getvalue()
+
+def file_hash(file):
+    """
+    SHA-256 of the file content.
+    """
+    digest = hashlib.sha256()
+    with open(file, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_manifest(manifest_path):
+    """
+    Manifest of the last run, empty if missing or written by another version.
+    """
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest.get('version') == MANIFEST_VERSION:
+            return manifest
+    return {'version': MANIFEST_VERSION, 'files': {}}
+
+def save_manifest(manifest_path, files):
+    with open(manifest_path, 'w') as f:
+        json.dump({'version': MANIFEST_VERSION, 'files': files}, f, indent=2)
+
+def season_output_file(output_path, season):
+    """
+    Season TSV written for season, None for invalid seasons.
+    """
+    season_range = get_season_range(season)
+    if season_range:
+        return os.path.join(output_path, f"orders_{season_range[0]}_{season_range[1]}.tsv")
+    return None
+
+def format_prices(column):
+    """
+    Prices as text with two decimals, missing ones as 0.00.
+    """
+    return column.fillna(0.0).astype(float).map('{:.2f}'.format).astype(object)
+
+def to_typed(season_df):
+    """
+    Season frame with the PARQUET_TYPES column types and dates, lesson
+    timestamps are already tz-aware from validate_and_fix_dataframe.
+    """
+    typed = season_df.copy()
+    for col, dtype in PARQUET_TYPES.items():
+        if col in typed.columns:
+            if dtype == 'category':
+                typed[col] = typed[col].astype('category')
+            else:
+                typed[col] = pd.to_numeric(typed[col], errors='coerce').astype(dtype)
+    for col in PARQUET_DATE_COLUMNS:
+        if col in typed.columns:
+            typed[col] = pd.to_datetime(typed[col], errors='coerce', format='ISO8601')
+    return typed
+
+def write_season(season_df, output_file, parquet=False):
+    """
+    Formats and writes one season file, and its typed Parquet copy if asked,
+    returns the first two lines of the TSV.
+    """
+    if parquet:
+        to_typed(season_df).to_parquet(parquet_output_file(output_file), index=False)
+
+    # Format price columns consistently before saving
+    for col in ['price_without_vat', 'price_to_pay']:
+        season_df[col] = format_prices(season_df[col])
+
+    # Ensure timestamps are properly formatted
+    for col in ['timestamp_start_lesson', 'timestamp_end_lesson']:
+        season_df[col] = format_lesson_timestamps(season_df[col])
+
+    # Save to file with proper encoding
+    season_df.to_csv(output_file, sep='\t', index=False, encoding='utf-8')
+    return season_df.head(1).to_csv(sep='\t', index=False).split('\n')[:2]
+
+def parquet_output_file(output_file):
+    """
+    Parquet file next to the season TSV.
+    """
+    return os.path.splitext(output_file)[0] + '.parquet'
+
 def main():
+    parser = argparse.ArgumentParser(description="Combine hand increment order TSVs into season TSVs")
+    parser.add_argument('--full', action='store_true',
+                        help="Ignore the manifest, re-read every input and rewrite every season")
+    parser.add_argument('--parquet', action='store_true',
+                        help="Also write typed Parquet season files next to the TSVs (needs pyarrow)")
+    parser.add_argument('--no-store', action='store_true',
+                        help="Do not upsert the season rows into the fact store")
+    args = parser.parse_args()
+
     # Input and output paths
-    input_path = "/home/hylmarj/_scratch/staging-goldsport-analytics/goldsport__orders___gsp_dataset___hand_increment/method=hand_increment/source=goldsport"
-    output_path = "/home/hylmarj/_scratch/staging-goldsport-analytics/goldsport__orders___gsp_dataset___auto_full/method=auto_full/source=goldsport"
+    input_path = INPUT_PATH
+    output_path = OUTPUT_PATH
     
     print(f"Script started")
     
     # Create output directory if it doesn't exist
     os.makedirs(output_path, exist_ok=True)
     
-    # Look for TSV files
-    all_files = glob.glob(os.path.join(input_path, "*.tsv"))
+    # Look for TSV files, sorted so the combined order does not depend on the file system
+    all_files = sorted(glob.glob(os.path.join(input_path, "*.tsv")))
     print(f"\nFound {len(all_files)} TSV files:")
     for file in all_files:
         print(f"  - {file}")
     
-    # Initialize an empty list to store all DataFrames
-    dfs = []
-    
-    # Read all TSV files with improved error handling
+    # Inputs unchanged since the last run are not read again, compared by size and
+    # mtime first and by content hash only when those differ
+    manifest_path = os.path.join(output_path, MANIFEST_FILENAME)
+    cache_path = os.path.join(output_path, CACHE_DIRNAME)
+    os.makedirs(cache_path, exist_ok=True)
+    previous = {} if args.full else load_manifest(manifest_path)['files']
+    entries = {}
+    changed_files = []
     for file in all_files:
-        df = read_tsv_file(file)
-        if df is None:
+        stat = os.stat(file)
+        entry = previous.get(file)
+        # Inputs without data have no cached frame and need nothing else
+        cached = entry is not None and (entry['cache'] is None
+                                        or os.path.exists(os.path.join(cache_path, entry['cache'])))
+        if cached and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            entries[file] = entry
             continue
-            
-        if df.empty:
-            print(f"Warning: Empty DataFrame from {file}")
+        digest = file_hash(file)
+        if cached and entry['hash'] == digest:
+            entries[file] = dict(entry, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
             continue
-        
-        # Add validation step
-        df = validate_and_fix_dataframe(df, file)
+        changed_files.append(file)
+        entries[file] = {'hash': digest, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                         'seasons': [], 'cache': None}
+
+    # Seasons of changed and removed inputs, before and after the change
+    affected_seasons = set()
+    for file, entry in previous.items():
+        if file not in entries or file in changed_files:
+            affected_seasons.update(entry['seasons'])
+            if entry['cache'] and entry['cache'] not in {e['cache'] for e in entries.values()}:
+                cache_file = os.path.join(cache_path, entry['cache'])
+                if os.path.exists(cache_file):
+                    os.remove(cache_file)
+    print(f"\nChanged inputs: {len(changed_files)}, removed inputs: {len(set(previous) - set(entries))}")
+
+    # Read and validate the changed TSV files in parallel, results come back in file order
+    loaded = {}
+    if changed_files:
+        with ProcessPoolExecutor(max_workers=max(1, min(len(changed_files), os.cpu_count() or 1))) as pool:
+            loaded = dict(zip(changed_files, pool.map(load_file, changed_files)))
+
+    for file in changed_files:
+        df, output = loaded[file]
+        print(output, end='')
         if df is None:
-            print(f"Error: Could not fix data format in {file}")
+            continue
+        seasons = sorted(df['season'].dropna().unique().tolist())
+        entries[file]['seasons'] = seasons
+        entries[file]['cache'] = f"{entries[file]['hash']}.pkl"
+        df.to_pickle(os.path.join(cache_path, entries[file]['cache']))
+        affected_seasons.update(seasons)
+
+    # Seasons whose file went missing are written again
+    for entry in entries.values():
+        for season in entry['seasons']:
+            output_file = season_output_file(output_path, season)
+            if output_file and not os.path.exists(output_file):
+                affected_seasons.add(season)
+            elif output_file and args.parquet and not os.path.exists(parquet_output_file(output_file)):
+                affected_seasons.add(season)
+
+    if not affected_seasons:
+        save_manifest(manifest_path, entries)
+        print("No input changes, season files are up to date")
+        return
+    print(f"Seasons to write: {sorted(affected_seasons)}")
+
+    # Initialize an empty list to store all DataFrames
+    dfs = []
+
+    # Inputs in file order, unchanged ones from the cache if they hold affected seasons
+    for file in all_files:
+        if file in loaded:
+            df = loaded[file][0]
+            if df is None:
+                continue
+            print(f"Successfully read {file}")
+        elif affected_seasons.intersection(entries[file]['seasons']):
+            df = pd.read_pickle(os.path.join(cache_path, entries[file]['cache']))
+            print(f"Unchanged, read from cache {file}")
+        else:
             continue
 
-        print(f"Successfully read {file}")
         print(f"Shape: {df.shape}")
         print("Columns:", df.columns.tolist())
         
@@ -170,61 +433,63 @@ def main():
     # Combine all DataFrames
     combined_df = pd.concat(dfs, ignore_index=False)
     print(f"\nCombined DataFrame shape: {combined_df.shape}")
+    # Compacted once for all files, date_order keeps its dtype so the season sort orders ties as before
+    combined_df, report = compact_frame(combined_df, 'combined DataFrame', exclude=['date_order'])
+    print(report)
     
-    # Get unique seasons
-    unique_seasons = sorted(combined_df['season'].unique())
+    # Split into seasons in one pass, only the affected ones are complete in combined_df
+    seasons = [(season, season_df) for season, season_df in combined_df.groupby('season', sort=True, observed=True)
+               if season in affected_seasons]
+    unique_seasons = [season for season, _ in seasons]
     print(f"Unique seasons found: {unique_seasons}")
     
-    # Process each season
-    for season in unique_seasons:
-        # Skip invalid seasons
-        if not season.endswith('/20') and not season.endswith('/21') and not season.endswith('/22') and not season.endswith('/23') and not season.endswith('/24') and not season.endswith('/25'):
-            print(f"\nSkipping invalid season: {season}")
-            continue
-            
-        season_range = get_season_range(season)
-        if season_range:
-            season_key = f"orders_{season_range[0]}_{season_range[1]}"
-            
-            # Get data for this season
-            season_df = combined_df[combined_df['season'] == season].copy()
-            
-            # Sort by date_order
-            season_df = season_df.sort_values('date_order')
+    # Season files are formatted and written concurrently, reports are printed in season order
+    display_columns = ['id_order', 'date_order', 'name_participant', 'season', 'level', 'price_to_pay']
+    reports = []
+    with ThreadPoolExecutor(max_workers=max(1, min(len(seasons), os.cpu_count() or 1))) as pool:
+        for season, season_df in seasons:
+            # Skip invalid seasons
+            if not season.endswith('/20') and not season.endswith('/21') and not season.endswith('/22') and not season.endswith('/23') and not season.endswith('/24') and not season.endswith('/25'):
+                reports.append((season, None, None, None, None, None))
+                continue
+
+            output_file = season_output_file(output_path, season)
+            if output_file:
+                # Sort by date_order
+                season_df = season_df.sort_values('date_order')
+                sample = season_df[display_columns].head(3)
+                # Upserted before write_season formats the frame in place
+                stored = None if args.no_store else upsert_orders(season, season_df)
+                reports.append((season, output_file, season_df, sample, stored,
+                                pool.submit(write_season, season_df, output_file, args.parquet)))
+
+        for season, output_file, season_df, sample, stored, written in reports:
+            if output_file is None:
+                print(f"\nSkipping invalid season: {season}")
+                continue
+            season_key = os.path.splitext(os.path.basename(output_file))[0]
             
             # Print sample of the data with better formatting
             print(f"\n{'='*80}")
             print(f"Sample rows from {season_key}:")
             print(f"{'='*80}")
-            display_columns = ['id_order', 'date_order', 'name_participant', 'season', 'level', 'price_to_pay']
-            print(season_df[display_columns].head(3))
-            
-            # Format price columns consistently before saving 
-            for col in ['price_without_vat', 'price_to_pay']:
-                season_df[col] = season_df[col].apply(lambda x: '{:.2f}'.format(float(x)) if pd.notnull(x) else '0.00')
-            
-            # Ensure timestamps are properly formatted
-            for col in ['timestamp_start_lesson', 'timestamp_end_lesson']:
-                season_df[col] = season_df[col].apply(lambda x: 
-                    x if pd.notnull(x) and '+01:00' in x 
-                    else None if pd.isnull(x)
-                    else x + ' +01:00' if 'T' in str(x) 
-                    else x)
+            print(sample)
             
-            # Save to file with proper encoding
-            output_file = os.path.join(output_path, f"{season_key}.tsv")
-            season_df.to_csv(output_file, sep='\t', index=False, encoding='utf-8')
+            first_lines = written.result()
             print(f"\nCreated {output_file}")
             print(f"File size: {os.path.getsize(output_file):,} bytes")
-            
-            # Verify file was created and show first few lines
-            if os.path.exists(output_file):
-                with open(output_file, 'r') as f:
-                    print("\nFirst 2 lines of created file:")
-                    print(f.readline().strip())  # header
-                    print(f.readline().strip())  # first data row
+            print("\nFirst 2 lines of created file:")
+            print(first_lines[0].strip())  # header
+            print(first_lines[1].strip())  # first data row
             
             print(f"Total rows saved: {len(season_df)}")
+            if args.parquet:
+                print(f"Typed copy: {parquet_output_file(output_file)}")
+            if stored is not None:
+                print(f"Upserted {stored} rows into the fact store")
+
+    # Saved only once every season is written and upserted, a failed run is redone by the next one
+    save_manifest(manifest_path, entries)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
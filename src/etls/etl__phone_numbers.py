@@ -1,17 +1,330 @@
 #!/usr/bin/env python3
+import argparse
+import csv
+import hashlib
+import heapq
+import json
+import numpy as np
 import pandas as pd
 import re
 from datetime import datetime
 import logging
+import sqlite3
+import tempfile
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-import sys
-from typing import Tuple, Optional, List
+from typing import Iterable, List, NamedTuple, Optional, Pattern, Tuple
+
+from common__dtypes import compact_frame
+from common__store import upsert_phone_numbers
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+CACHE_FILENAME = 'phone_numbers_cache.sqlite'
+
+OUTPUT_BASE = Path("/home/hylmarj/_scratch/staging-goldsport-analytics/goldsport__phone_numbers___gsp_dataset___auto_full/method=auto_full/source=goldsport")
+
+DEFAULT_LANGUAGE = 'en'
+
+class CountryRule(NamedTuple):
+    """
+    How numbers of one country are recognized, normalized and validated
+    """
+    country: str
+    # Calling code without '+', codes of all rules must be prefix-free
+    code: str
+    # National mobile number following the calling code
+    mobile_pattern: str
+    # Output language of the number, regardless of the order language
+    language: str = DEFAULT_LANGUAGE
+    # Longer numbers are cut to this length (including '+') before validation
+    max_length: Optional[int] = None
+    # Drop redundant leading zeros right after '+<code>'
+    strip_trunk_zero: bool = False
+    # Whole numbers written without calling code that belong to this country
+    local_pattern: Optional[str] = None
+
+# Supported countries, adding one only takes a new rule here
+COUNTRY_RULES = [
+    CountryRule('CZ', '420', r'[6-7][0-9]{8}', 'cs', max_length=13, strip_trunk_zero=True,
+                local_pattern=r'[67].{8}'),  # Czech mobile, 9 digits starting with 6 or 7 without prefix
+    CountryRule('DE', '49', r'[1][5-7][0-9]{7,10}', 'de', max_length=14, strip_trunk_zero=True),  # German mobile
+    CountryRule('PL', '48', r'[4-8][0-9]{8}', 'pl', max_length=12, strip_trunk_zero=True),  # Polish mobile
+    CountryRule('NL', '31', r'[6][0-9]{8}', max_length=12),  # Dutch mobile
+    CountryRule('IE', '353', r'[8][0-9]{8}'),  # Irish mobile
+    CountryRule('IL', '972', r'[5][0-9]{8}'),  # Israeli mobile
+    CountryRule('AT', '43', r'[6][0-9]{9,10}', 'de'),  # Austrian mobile, German speaking
+]
+
+# Country calling codes recognized in notes
+COUNTRY_CODES = [rule.code for rule in COUNTRY_RULES]
+_CODES = '|'.join(COUNTRY_CODES)
+
+# Separators splitting a note into independently scanned parts
+PART_SEPARATORS = r'[,;\n]'
+
+# Typical Czech 9-digit format, the number itself is group 1
+CZECH_PATTERN = r'(?:^|[^\d])([67][0-9]{2}[\s-]?[0-9]{3}[\s-]?[0-9]{3})(?:$|[^\d])'
+
+INTERNATIONAL_PATTERNS = [
+    # International format with +
+    rf'\+\s*(?:{_CODES})[0-9\s-]{{8,}}',
+
+    # Format starting with 00
+    rf'00\s*(?:{_CODES})[0-9\s-]{{8,}}',
+
+    # Without + but with country code
+    rf'(?:^|[^\d])(?:{_CODES})[0-9\s-]{{8,}}(?:$|[^\d])',
+]
+
+CANDIDATE_PATTERNS = [re.compile(pattern) for pattern in [CZECH_PATTERN] + INTERNATIONAL_PATTERNS]
+
+# Joins note parts for column-wise scanning, see extract_candidates
+PART_JOINER = '\x00\x00'
+
+# extract_phone_numbers capture cleanup and digit count as line-wise substitutions
+CAPTURE_CLEANUP = [(re.compile(r'^[^\d+\n]+|[^\d+\n]+$', re.MULTILINE), '')]
+DIGITS_ONLY = [(re.compile(r'[^\d\n]'), '')]
+
+# Input columns used by the extraction, the rest of the export is not read
+INPUT_COLUMNS = ['id_order', 'date_order', 'note', 'name_sponsor']
+
+VALID_COLUMNS = ['id_order', 'date_order', 'phone_number', 'country', 'language', 'name_sponsor']
+INVALID_COLUMNS = ['id_order', 'date_order', 'original_number', 'attempted_clean', 'attempted_country']
+SORT_COLUMNS = ['id_order', 'date_order', 'phone_number']
+
+class PhoneNormalizer:
+    """
+    Normalizes and validates phone numbers in one pass using COUNTRY_RULES.
+
+    Rules are dispatched by a dict lookup on the calling code, so the cost per
+    number does not grow with the number of supported countries.
+    """
+
+    def __init__(self, rules: List[CountryRule]):
+        self.rules = {rule.country: rule for rule in rules}
+        self.by_code = {rule.code: rule for rule in rules}
+        for code in self.by_code:
+            for other in self.by_code:
+                if other != code and other.startswith(code):
+                    raise ValueError(f"Calling code {code} is a prefix of {other}")
+        self.code_lengths = sorted({len(code) for code in self.by_code})
+        self.locals = [(re.compile(rule.local_pattern), rule) for rule in rules if rule.local_pattern]
+        self.validators = {rule.country: re.compile(rf'^\+{rule.code}{rule.mobile_pattern}$') for rule in rules}
+        # Everything but digits, '+' and '-' is dropped, descriptions included
+        self.non_number = re.compile(r'[^\d+-]')
+        self.non_number_lines = [(re.compile(r'[^\d+\n-]'), '')]
+
+    def dispatch(self, digits: str) -> Optional[CountryRule]:
+        """
+        Rule whose calling code starts digits
+        """
+        for length in self.code_lengths:
+            rule = self.by_code.get(digits[:length])
+            if rule:
+                return rule
+        return None
+
+    def normalize(self, number: str) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Returns the normalized number and its country, or None, None if invalid
+        """
+        return self.normalize_cleaned(self.non_number.sub('', number))
+
+    def normalize_many(self, numbers: Iterable[str]) -> List[Tuple[Optional[str], Optional[str]]]:
+        """
+        normalize over many numbers with one cleanup pass, newlines inside a
+        number are dropped first like every other non-number character
+        """
+        numbers = [number.replace('\n', '') for number in numbers]
+        return [self.normalize_cleaned(cleaned) for cleaned in sub_lines(numbers, self.non_number_lines)]
+
+    def normalize_cleaned(self, cleaned: str) -> Tuple[Optional[str], Optional[str]]:
+        """
+        normalize for a number already stripped to digits, '+' and '-'
+        """
+        if cleaned.startswith('00'):
+            cleaned = '+' + cleaned[2:]
+
+        if cleaned.startswith('+'):
+            rule = self.dispatch(cleaned[1:])
+            # Handle numbers with redundant leading zeros after country code
+            if rule and rule.strip_trunk_zero:
+                prefix = len(rule.code) + 1
+                cleaned = cleaned[:prefix] + cleaned[prefix:].lstrip('0')
+        else:
+            # Add missing plus for country codes, or the code of a local number
+            rule = self.dispatch(cleaned)
+            if rule:
+                cleaned = '+' + cleaned
+            else:
+                for local, local_rule in self.locals:
+                    if local.fullmatch(cleaned):
+                        rule = local_rule
+                        cleaned = f'+{rule.code}{cleaned}'
+                        break
+
+        if not rule or len(cleaned) < 9:
+            return None, None
+
+        if rule.max_length:
+            cleaned = cleaned[:rule.max_length]
+        if not self.validators[rule.country].match(cleaned):
+            return None, None
+        return cleaned, rule.country
+
+    def is_valid(self, number: str, country: str) -> bool:
+        validator = self.validators.get(country)
+        return bool(validator and validator.match(number))
+
+NORMALIZER = PhoneNormalizer(COUNTRY_RULES)
+
+# Bump when a change to PhoneNormalizer changes its results, 2 fixed batches of numbers with newlines
+NORMALIZER_VERSION = 2
+# Cached and watermarked results are only reused with the normalizer and rule table they were computed with
+RULES_VERSION = hashlib.sha1(repr((NORMALIZER_VERSION, COUNTRY_RULES)).encode()).hexdigest()[:12]
+
+class NormalizationCache:
+    """
+    Memoizes PhoneNormalizer results by raw fragment in an in-process LRU,
+    backed by an optional SQLite file that persists them across runs
+    """
+
+    # Fragments looked up per SQLite query, below the bound parameter limit
+    QUERY_BATCH = 500
+
+    def __init__(self, normalizer: PhoneNormalizer, version: str, maxsize: int = 100_000):
+        self.normalizer = normalizer
+        self.version = version
+        self.maxsize = maxsize
+        self.memory = OrderedDict()
+        self.connection = None
+        self.pending = []
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def open(self, path: Path) -> None:
+        """
+        Persist results to the SQLite file at path, creating it if needed
+        """
+        self.close()
+        self.connection = sqlite3.connect(str(path))
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS normalized ("
+            "fragment TEXT NOT NULL, version TEXT NOT NULL, phone_number TEXT, country TEXT, "
+            "PRIMARY KEY (fragment, version))")
+
+    def close(self) -> None:
+        if self.connection is not None:
+            self.flush()
+            self.connection.close()
+            self.connection = None
+
+    def flush(self) -> None:
+        """
+        Write results computed since the last flush to the SQLite file
+        """
+        if self.connection is not None and self.pending:
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO normalized VALUES (?, ?, ?, ?)",
+                    [(fragment, self.version, number, country) for fragment, (number, country) in self.pending])
+        self.pending = []
+
+    def remember(self, fragment: str, result: Tuple[Optional[str], Optional[str]]) -> None:
+        self.memory[fragment] = result
+        if len(self.memory) > self.maxsize:
+            self.memory.popitem(last=False)
+
+    def load(self, fragments: List[str]) -> dict:
+        """
+        Results stored in the SQLite file for fragments, by fragment
+        """
+        found = {}
+        if self.connection is None or not fragments:
+            return found
+        if len(fragments) > self.QUERY_BATCH:
+            # One scan of the version beats many IN queries for large batches
+            wanted = set(fragments)
+            rows = self.connection.execute(
+                "SELECT fragment, phone_number, country FROM normalized WHERE version = ?", [self.version])
+            for fragment, number, country in rows:
+                if fragment in wanted:
+                    found[fragment] = (number, country)
+            return found
+        for start in range(0, len(fragments), self.QUERY_BATCH):
+            batch = fragments[start:start + self.QUERY_BATCH]
+            rows = self.connection.execute(
+                f"SELECT fragment, phone_number, country FROM normalized "
+                f"WHERE version = ? AND fragment IN ({', '.join('?' * len(batch))})",
+                [self.version] + batch)
+            for fragment, number, country in rows:
+                found[fragment] = (number, country)
+        return found
+
+    def normalize(self, number: str) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Cached PhoneNormalizer.normalize
+        """
+        return self.normalize_many([number])[0]
+
+    def normalize_many(self, numbers: Iterable[str]) -> List[Tuple[Optional[str], Optional[str]]]:
+        """
+        Cached PhoneNormalizer.normalize_many, only fragments seen neither in
+        this process nor in the SQLite file are normalized
+        """
+        numbers = list(numbers)
+        results = [None] * len(numbers)
+        missing = {}
+        for position, number in enumerate(numbers):
+            result = self.memory.get(number)
+            if result is None:
+                missing.setdefault(number, []).append(position)
+            else:
+                self.memory.move_to_end(number)
+                self.hits += 1
+                results[position] = result
+
+        stored = self.load(list(missing))
+        self.disk_hits += len(stored)
+        computed = [fragment for fragment in missing if fragment not in stored]
+        self.misses += len(computed)
+        fresh = list(zip(computed, self.normalizer.normalize_many(computed)))
+        if self.connection is not None:
+            self.pending.extend(fresh)
+
+        for fragment, result in list(stored.items()) + fresh:
+            self.remember(fragment, result)
+            for position in missing[fragment]:
+                results[position] = result
+        return results
+
+CACHE = NormalizationCache(NORMALIZER, RULES_VERSION)
+
+# Output language is set strictly by the country of the number
+COUNTRY_LANGUAGES = {rule.country: rule.language for rule in COUNTRY_RULES}
+
 def clean_phone_number(number: str) -> Tuple[Optional[str], Optional[str], str]:
+    """
+    Normalizes and validates a number with the country rules,
+    returns (cleaned, country, original) with None, None if invalid
+    """
+    if not isinstance(number, str):
+        return None, None, str(number)
+
+    cleaned, country = CACHE.normalize(number)
+    return cleaned, country, number
+
+# Only keeping this function for reference, clean_phone_number normalizes with NORMALIZER
+def clean_phone_number_reference(number: str) -> Tuple[Optional[str], Optional[str], str]:
     """
     Enhanced phone number cleaning function with improved pattern matching
     """
@@ -118,6 +431,91 @@ def clean_phone_number(number: str) -> Tuple[Optional[str], Optional[str], str]:
     
     return None, None, original
 
+class CandidateScanner:
+    """
+    Finds phone number candidates of all formats in a single regex pass per
+    note part, with the same results as running CZECH_PATTERN and
+    INTERNATIONAL_PATTERNS one after another.
+
+    Every format is an alternative of one zero-width lookahead, so matches of
+    different formats may overlap like they do with separate scans. The formats
+    start on different characters, so at most one of them matches at a position.
+    Within a format, matches that a separate finditer would skip (overlapping,
+    or sharing a boundary character with the previous match) are dropped.
+    """
+
+    def __init__(self, country_codes: List[str]):
+        codes = '|'.join(country_codes)
+        formats = (
+            # Typical Czech 9-digit format
+            r'(?<!\d)(?P<czech>[67][0-9]{2}[\s-]?[0-9]{3}[\s-]?[0-9]{3})(?!\d)'
+            # International format with +
+            rf'|(?P<plus>\+\s*(?:{codes})[0-9\s-]{{8,}})'
+            # Format starting with 00
+            rf'|(?P<zeros>00\s*(?:{codes})[0-9\s-]{{8,}})'
+            # Without + but with country code, including the trailing boundary
+            rf'|(?<!\d)(?P<bare>(?:{codes})[0-9\s-]{{8,}}(?:$|[^\d]))'
+        )
+        # Leading with the characters a format can start on lets the regex
+        # engine skip other text quickly, the lookbehind then steps back over
+        # that character and tries the formats from there. Czech and bare
+        # formats never start right after a digit
+        after_non_digit = ''.join(sorted({'6', '7'} | {code[0] for code in country_codes}))
+        self.pattern = re.compile(rf'(?:[+0]|[{after_non_digit}](?<!\d.))(?<=(?=(?:{formats})).)')
+        self.separators = re.compile(PART_SEPARATORS)
+        self.digit = re.compile(r'\d')
+        self.non_digits = re.compile(r'[^\d]')
+        self.edges = re.compile(r'^[^\d+]+|[^\d+]+$')
+
+    def scan_part(self, part: str) -> List[str]:
+        """
+        Candidates of one part in output order (Czech, +, 00, bare country
+        code), duplicates included
+        """
+        found = ([], [], [], [])
+        # Where the previous match of each format ended, boundaries included
+        ends = [0, 0, 0, 0]
+
+        for match in self.pattern.finditer(part):
+            group = match.lastindex
+            kind = group - 1
+            start, end = match.span(group)
+
+            if kind == 0 or kind == 3:
+                # Czech and bare formats consume the non-digit in front of the number
+                if start and start - 1 < ends[kind]:
+                    continue
+                if kind == 0:
+                    ends[0] = end + 1 if end < len(part) else end
+                    found[0].append(match.group(group))
+                    continue
+                number = part[start - 1 if start else start:end]
+            else:
+                if start < ends[kind]:
+                    continue
+                number = match.group(group)
+            ends[kind] = end
+
+            # Clean up captures, only add if not a partial number
+            number = self.edges.sub('', number)
+            if len(self.non_digits.sub('', number)) >= 9:
+                found[kind].append(number)
+
+        return found[0] + found[1] + found[2] + found[3]
+
+    def scan(self, text: str) -> List[str]:
+        """
+        Unique candidates of a note in order of first occurrence
+        """
+        numbers = []
+        for part in self.separators.split(text):
+            # Skip parts that are clearly not phone numbers
+            if self.digit.search(part):
+                numbers.extend(self.scan_part(part))
+        return list(dict.fromkeys(numbers))
+
+SCANNER = CandidateScanner(COUNTRY_CODES)
+
 def extract_phone_numbers(text: str) -> List[str]:
     """
     Enhanced phone number extraction with improved pattern matching
@@ -125,8 +523,18 @@ def extract_phone_numbers(text: str) -> List[str]:
     if not isinstance(text, str):
         return []
     
+    return SCANNER.scan(text)
+
+# Only keeping this function for reference, extract_phone_numbers scans with SCANNER
+def extract_phone_numbers_reference(text: str) -> List[str]:
+    """
+    Enhanced phone number extraction with improved pattern matching
+    """
+    if not isinstance(text, str):
+        return []
+    
     # Split text by common separators
-    parts = re.split(r'[,;\n]', text)
+    parts = re.split(PART_SEPARATORS, text)
     numbers = []
     
     for part in parts:
@@ -135,25 +543,14 @@ def extract_phone_numbers(text: str) -> List[str]:
             continue
             
         # Handle typical Czech 9-digit format first
-        czech_matches = re.finditer(r'(?:^|[^\d])([67][0-9]{2}[\s-]?[0-9]{3}[\s-]?[0-9]{3})(?:$|[^\d])', part)
+        czech_matches = re.finditer(CZECH_PATTERN, part)
         for match in czech_matches:
             num = match.group(1)
             if num and len(re.sub(r'[^\d]', '', num)) == 9:
                 numbers.append(num)
         
         # Look for international formats
-        patterns = [
-            # International format with + 
-            r'\+\s*(?:420|49|48|31|353|972|43)[0-9\s-]{8,}',
-            
-            # Format starting with 00
-            r'00\s*(?:420|49|48|31|353|972|43)[0-9\s-]{8,}',
-            
-            # Without + but with country code
-            r'(?:^|[^\d])(?:420|49|48|31|353|972|43)[0-9\s-]{8,}(?:$|[^\d])',
-        ]
-        
-        for pattern in patterns:
+        for pattern in INTERNATIONAL_PATTERNS:
             matches = re.finditer(pattern, part)
             for match in matches:
                 num = match.group().strip()
@@ -176,20 +573,7 @@ def is_valid_number(number: str, country: str) -> bool:
     if not isinstance(number, str):
         return False
         
-    patterns = {
-        'CZ': r'^\+420[6-7][0-9]{8}$',  # Czech mobile
-        'DE': r'^\+49[1][5-7][0-9]{7,10}$',  # German mobile
-        'PL': r'^\+48[4-8][0-9]{8}$',  # Polish mobile
-        'NL': r'^\+31[6][0-9]{8}$',  # Dutch mobile
-        'IE': r'^\+353[8][0-9]{8}$',  # Irish mobile
-        'IL': r'^\+972[5][0-9]{8}$',  # Israeli mobile
-        'AT': r'^\+43[6][0-9]{9,10}$',  # Austrian mobile
-    }
-    
-    if country not in patterns:
-        return False
-        
-    return bool(re.match(patterns[country], number))
+    return NORMALIZER.is_valid(number, country)
 
 # Only keeping this function for reference, it's no longer used
 def get_language_code(country_code: str) -> str:
@@ -205,72 +589,539 @@ def get_language_code(country_code: str) -> str:
     
     return country_to_language.get(country_code, 'en')  # Default to English if not found
 
-def process_file(input_path: str) -> None:
+def extract_rows(df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Row by row extraction, kept as the reference for the column-wise mode
+    """
+    output_data = []
+    invalid_numbers = []
+    # Source row labels of the results, see extract_sharded
+    output_index = []
+    invalid_index = []
+    # iterrows turns integer ids into floats, they are taken from the column instead
+    ids = df['id_order'].array
+
+    for position, (label, row) in enumerate(df.iterrows()):
+        if pd.isna(row['note']):
+            continue
+
+        numbers = extract_phone_numbers(str(row['note']))
+
+        for number in numbers:
+            # Numbers come back from clean_phone_number already validated
+            cleaned_number, country, original = clean_phone_number(number)
+            if cleaned_number:
+                name_sponsor = row.get('name_sponsor', '') if not pd.isna(row.get('name_sponsor', '')) else ''
+
+                output_index.append(label)
+                output_data.append({
+                    'id_order': ids[position],
+                    'date_order': row['date_order'],
+                    'phone_number': cleaned_number,
+                    'country': country,
+                    'language': COUNTRY_LANGUAGES.get(country, DEFAULT_LANGUAGE),
+                    'name_sponsor': name_sponsor
+                })
+            else:
+                invalid_index.append(label)
+                invalid_numbers.append({
+                    'id_order': ids[position],
+                    'date_order': row['date_order'],
+                    'original_number': original,
+                    'attempted_clean': cleaned_number if cleaned_number else 'None',
+                    'attempted_country': country if country else 'None'
+                })
+
+    return (pd.DataFrame(output_data, columns=VALID_COLUMNS, index=output_index),
+            pd.DataFrame(invalid_numbers, columns=INVALID_COLUMNS, index=invalid_index))
+
+def sub_lines(lines: Iterable[str], steps: List[Tuple[Pattern, str]]) -> List[str]:
+    """
+    Apply regex substitutions to many short newline-free strings at once by
+    running each of them over a single joined string
+    """
+    lines = list(lines)
+    if not lines:
+        return []
+    joined = '\n'.join(lines)
+    if joined.count('\n') == len(lines) - 1:
+        for pattern, replacement in steps:
+            joined = pattern.sub(replacement, joined)
+        result = joined.split('\n')
+        if len(result) == len(lines):
+            return result
+    # Strings with newlines of their own would shift every later result, they are done one by one
+    result = []
+    for line in lines:
+        for pattern, replacement in steps:
+            line = pattern.sub(replacement, line)
+        result.append(line)
+    return result
+
+def extract_candidates(notes: pd.Series) -> pd.DataFrame:
+    """
+    Column-wise equivalent of extract_phone_numbers over a whole note Series.
+
+    Returns a long table of (row, candidate) where row is the position in notes,
+    ordered and deduplicated per note exactly like extract_phone_numbers.
+    """
+    # Participants of an order share its note, so each distinct note is scanned once
+    present = notes.notna().to_numpy()
+    note_codes, texts = pd.factorize(pd.Series(notes.to_numpy()[present], dtype=object).astype(str))
+    rows = np.flatnonzero(present)
+
+    # One entry per (note, part), parts split exactly like extract_phone_numbers
+    parts = pd.Series(texts, dtype=object).str.split(PART_SEPARATORS, regex=True).explode()
+    part_notes = parts.index.to_numpy()
+    part_texts = parts.to_numpy(dtype=object)
+
+    # Scan all parts at once: the joiner holds no digit, whitespace, '+' or '-',
+    # so no match crosses it and each side consumes at most one of its characters
+    # as a boundary, which keeps every pattern's finditer semantics per part
+    joined = PART_JOINER.join(part_texts)
+    lengths = np.fromiter(map(len, part_texts), dtype=np.int64, count=len(part_texts))
+    part_starts = np.concatenate(([0], np.cumsum(lengths[:-1] + len(PART_JOINER))))
+
+    ends, patterns, found = [], [], []
+    for position, pattern in enumerate(CANDIDATE_PATTERNS):
+        matches = list(pattern.finditer(joined))
+        match_ends = np.fromiter((match.end() - 1 for match in matches), dtype=np.int64, count=len(matches))
+        if position == 0:
+            # Czech pattern captures the number only
+            numbers = [match.group(1) for match in matches]
+        else:
+            # Clean up captures and only keep if not a partial number
+            numbers = sub_lines([match.group() for match in matches], CAPTURE_CLEANUP)
+            digits = sub_lines(numbers, DIGITS_ONLY)
+            keep = np.fromiter(map(len, digits), dtype=np.int64, count=len(digits)) >= 9
+            match_ends = match_ends[keep]
+            numbers = [number for number, kept in zip(numbers, keep) if kept]
+        ends.append(match_ends)
+        patterns.append(np.full(len(numbers), position, dtype=np.int64))
+        found.extend(numbers)
+
+    # Order as extract_phone_numbers does: by part, then pattern, then position.
+    # Matches are located by their last character, a leading boundary may
+    # belong to the joiner in front of the part
+    ends = np.concatenate(ends)
+    part_ids = np.searchsorted(part_starts, ends, side='right') - 1
+    order = np.lexsort((ends, np.concatenate(patterns), part_ids))
+    candidates = pd.DataFrame({
+        'note': part_notes[part_ids[order]].astype(np.int64),
+        'candidate': np.asarray(found, dtype=object)[order],
+    })
+
+    # Remove duplicates within a note while preserving first occurrence order
+    candidates = candidates.drop_duplicates()
+
+    # Expand the candidates of each distinct note back to all rows sharing it
+    counts = np.bincount(candidates['note'].to_numpy(), minlength=len(texts))
+    firsts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    repeats = counts[note_codes]
+    offsets = np.cumsum(repeats) - repeats
+    positions = np.repeat(firsts[note_codes] - offsets, repeats) + np.arange(repeats.sum())
+    return pd.DataFrame({
+        'row': np.repeat(rows, repeats).astype(np.int64),
+        'candidate': candidates['candidate'].to_numpy()[positions],
+    })
+
+def normalize_numbers(numbers: pd.Series) -> pd.DataFrame:
+    """
+    Column-wise clean_phone_number, returns phone_number and country per
+    input, both None where invalid
+    """
+    normalized = CACHE.normalize_many(numbers.astype(str))
+    return pd.DataFrame(normalized or None, columns=['phone_number', 'country'],
+                        index=numbers.index, dtype=object)
+
+def extract_columns(df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Column-wise extraction over the whole note column with a single
+    normalize and validate pass per distinct candidate
+    """
+    candidates = extract_candidates(df['note'])
+    rows = candidates['row'].to_numpy()
+
+    # Candidates repeat a lot across orders, normalize each distinct one once
+    codes, uniques = pd.factorize(candidates['candidate'])
+    normalized = normalize_numbers(pd.Series(uniques, dtype=object))
+    normalized['language'] = [COUNTRY_LANGUAGES.get(country, DEFAULT_LANGUAGE) for country in normalized['country']]
+    numbers = normalized['phone_number'].to_numpy(dtype=object)[codes]
+    countries = normalized['country'].to_numpy(dtype=object)[codes]
+    languages = normalized['language'].to_numpy(dtype=object)[codes]
+    valid = pd.notna(numbers)
+
+    labels = df.index.to_numpy()[rows]
+    # The array keeps nullable integer ids nullable integers
+    id_order = df['id_order'].array[rows]
+    date_order = df['date_order'].to_numpy()[rows]
+    if 'name_sponsor' in df.columns:
+        name_sponsor = df['name_sponsor'].to_numpy(dtype=object)[rows]
+        name_sponsor = np.where(pd.isna(name_sponsor), '', name_sponsor)
+    else:
+        name_sponsor = np.full(len(rows), '', dtype=object)
+
+    output_df = pd.DataFrame({
+        'id_order': id_order[valid],
+        'date_order': date_order[valid],
+        'phone_number': numbers[valid],
+        'country': countries[valid],
+        'language': languages[valid],
+        'name_sponsor': name_sponsor[valid],
+    }, columns=VALID_COLUMNS, index=labels[valid])
+
+    # Invalid numbers never come back cleaned from clean_phone_number
+    invalid = ~valid
+    invalid_df = pd.DataFrame({
+        'id_order': id_order[invalid],
+        'date_order': date_order[invalid],
+        'original_number': candidates['candidate'].to_numpy()[invalid],
+        'attempted_clean': 'None',
+        'attempted_country': 'None',
+    }, columns=INVALID_COLUMNS, index=labels[invalid])
+
+    return output_df, invalid_df
+
+EXTRACTION_MODES = {
+    'column': extract_columns,
+    'row': extract_rows,
+}
+
+def init_worker(cache_path: Optional[Path]) -> None:
+    """
+    Give a pool process its own normalization cache connection
+    """
+    # The inherited SQLite handle must not be used across processes
+    CACHE.connection = None
+    CACHE.pending = []
+    if cache_path:
+        CACHE.open(cache_path)
+
+def extract_shard(mode: str, shard: pd.DataFrame) -> tuple:
+    """
+    Runs in a pool process, returns the extraction of one shard with its
+    timing, cache statistics and new cache entries for the parent to store
+    """
+    start = time.perf_counter()
+    CACHE.reset_stats()
+    output_df, invalid_df = EXTRACTION_MODES[mode](shard)
+    pending, CACHE.pending = CACHE.pending, []
+    return (output_df, invalid_df, time.perf_counter() - start,
+            (CACHE.hits, CACHE.disk_hits, CACHE.misses), pending)
+
+def shard_orders(df: pd.DataFrame, shards: int) -> List[pd.DataFrame]:
+    """
+    Split orders into contiguous id_order ranges with about the same number
+    of orders each, rows without id_order go to the last shard
+    """
+    ids = np.sort(df['id_order'].dropna().unique())
+    bounds = [part[-1] for part in np.array_split(ids, shards) if len(part)]
+    if not bounds:
+        return [df]
+    positions = np.searchsorted(bounds, df['id_order'].to_numpy(), side='left')
+    positions = np.minimum(positions, len(bounds) - 1)
+    return [df[positions == shard] for shard in range(len(bounds))]
+
+def extract_sharded(df: pd.DataFrame, mode: str, pool: ProcessPoolExecutor, workers: int,
+                    shard_log: List[str]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Extraction with the orders sharded by id_order across the pool. Results
+    are put back in source row order, so output does not depend on the
+    number of workers.
+    """
+    shards = shard_orders(df, workers)
+    results = pool.map(extract_shard, [mode] * len(shards), shards)
+
+    outputs, invalids = [], []
+    for shard, (output_df, invalid_df, seconds, stats, pending) in zip(shards, results):
+        outputs.append(output_df)
+        invalids.append(invalid_df)
+        hits, disk_hits, misses = stats
+        CACHE.hits += hits
+        CACHE.disk_hits += disk_hits
+        CACHE.misses += misses
+        if CACHE.connection is not None:
+            CACHE.pending.extend(pending)
+
+        ids = shard['id_order']
+        message = (f"Shard {len(shard_log) + 1}: id_order {ids.min()}-{ids.max()}, "
+                   f"{len(shard)} rows, {len(output_df)} valid, {len(invalid_df)} invalid in {seconds:.2f}s")
+        logger.info(message)
+        shard_log.append(message)
+
+    return (pd.concat(outputs).sort_index(kind='stable'),
+            pd.concat(invalids).sort_index(kind='stable'))
+
+def extract(df: pd.DataFrame, mode: str, pool: Optional[ProcessPoolExecutor] = None,
+            workers: int = 1, shard_log: Optional[List[str]] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Extract with the given mode, sharded across the pool if there is one
+    """
+    if pool is None:
+        return EXTRACTION_MODES[mode](df)
+    return extract_sharded(df, mode, pool, workers, shard_log)
+
+def read_orders(input_path: str, chunksize: Optional[int] = None):
+    """
+    Read the used columns of the orders TSV or typed Parquet season file,
+    in chunks of chunksize rows if given, with the compact dtype profile
+    """
+    if str(input_path).endswith('.parquet'):
+        frames = read_orders_parquet(input_path, chunksize)
+    else:
+        frames = pd.read_csv(input_path, sep='\t', usecols=lambda column: column in INPUT_COLUMNS,
+                             low_memory=False, chunksize=chunksize)
+    if not chunksize:
+        return compact_orders(frames, Path(input_path).name)
+    return (compact_orders(chunk, f"chunk {number + 1}") for number, chunk in enumerate(frames))
+
+def compact_orders(df: pd.DataFrame, label: str) -> pd.DataFrame:
+    """
+    Orders with the compact dtype profile, repeated notes and names become
+    categoricals and the memory saved is logged
+    """
+    df, report = compact_frame(df, label)
+    logger.info(report)
+    # Empty ids make the column float, which would write 3001.0 in some chunks and 3001 in others
+    ids = df['id_order']
+    if pd.api.types.is_float_dtype(ids) and (ids.dropna() % 1 == 0).all():
+        df['id_order'] = ids.astype('Int64')
+    return df
+
+def read_orders_parquet(input_path: str, chunksize: Optional[int] = None):
+    """
+    Parquet read_orders, only the used columns are loaded from disk
+    """
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(input_path)
+    columns = [column for column in INPUT_COLUMNS if column in parquet_file.schema_arrow.names]
+    if not chunksize:
+        df = parquet_file.read(columns=columns).to_pandas()
+    else:
+        df = (batch.to_pandas() for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns))
+    return df
+
+def sort_key(row: List[str]) -> tuple:
+    """
+    SORT_COLUMNS order of a valid number CSV row, numeric ids like the
+    DataFrame sort and empty values last
+    """
+    id_order, date_order, phone_number = row[:3]
+    try:
+        id_key = (0, float(id_order), '')
+    except ValueError:
+        id_key = (1 if id_order else 2, 0.0, id_order)
+    return id_key, (not date_order, date_order), phone_number
+
+def stream_outputs(input_path: str, mode: str, chunksize: int,
+                   output_path: Path, invalid_path: Path, unique_path: Path,
+                   pool: Optional[ProcessPoolExecutor] = None, workers: int = 1,
+                   shard_log: Optional[List[str]] = None) -> dict:
+    """
+    Chunked extraction writing the output CSVs incrementally. Each chunk's
+    valid numbers are sorted into a run file and the runs are merged, so
+    memory is bounded by the chunk size plus the sets of distinct order ids
+    and phone numbers. Returns the counts for the log.
+    """
+    summary = {'total_orders': 0, 'valid': 0, 'unique': 0, 'invalid': 0,
+               'countries': Counter(), 'languages': Counter()}
+    order_ids = set()
+    pd.DataFrame(columns=INVALID_COLUMNS).to_csv(invalid_path, index=False)
+
+    with tempfile.TemporaryDirectory(dir=output_path.parent) as run_dir:
+        run_paths = []
+        for number, chunk in enumerate(read_orders(input_path, chunksize)):
+            logger.info(f"Extracting phone numbers from chunk {number + 1} ({len(chunk)} rows)")
+            order_ids.update(chunk['id_order'].dropna())
+            output_df, invalid_df = extract(chunk, mode, pool, workers, shard_log)
+
+            invalid_df.to_csv(invalid_path, mode='a', header=False, index=False)
+            summary['invalid'] += len(invalid_df)
+
+            run_path = Path(run_dir) / f'run_{number:06d}.csv'
+            output_df.sort_values(SORT_COLUMNS).drop_duplicates()\
+                     .to_csv(run_path, index=False, header=False)
+            run_paths.append(run_path)
+
+        summary['total_orders'] = len(order_ids)
+        logger.info(f"Merging {len(run_paths)} sorted runs")
+
+        run_files = [open(run_path, newline='') for run_path in run_paths]
+        try:
+            merged = heapq.merge(*[csv.reader(run_file) for run_file in run_files], key=sort_key)
+            with open(output_path, 'w', newline='') as output_file, \
+                 open(unique_path, 'w', newline='') as unique_file:
+                output_writer = csv.writer(output_file, lineterminator='\n')
+                unique_writer = csv.writer(unique_file, lineterminator='\n')
+                output_writer.writerow(VALID_COLUMNS)
+                unique_writer.writerow(VALID_COLUMNS)
+
+                # Duplicate rows share the sort key, so only the current key group is kept
+                group_key, group_rows = None, set()
+                unique_numbers = set()
+                for row in merged:
+                    key = sort_key(row)
+                    if key != group_key:
+                        group_key, group_rows = key, set()
+                    if tuple(row) in group_rows:
+                        continue
+                    group_rows.add(tuple(row))
+
+                    output_writer.writerow(row)
+                    summary['valid'] += 1
+                    summary['countries'][row[3]] += 1
+                    summary['languages'][row[4]] += 1
+                    if row[2] not in unique_numbers:
+                        unique_numbers.add(row[2])
+                        unique_writer.writerow(row)
+                summary['unique'] = len(unique_numbers)
+        finally:
+            for run_file in run_files:
+                run_file.close()
+
+    return summary
+
+def file_hash(path: str) -> str:
+    """
+    SHA-256 of the file content
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def rows_hash(df: pd.DataFrame) -> str:
+    """
+    Order sensitive hash of the rows of df
+    """
+    return hashlib.sha256(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes()).hexdigest()
+
+def scalar(value):
+    """
+    Plain Python value of a numpy scalar, for JSON
+    """
+    return value.item() if hasattr(value, 'item') else value
+
+def processed_orders(df: pd.DataFrame, watermark: dict) -> pd.Series:
+    """
+    Rows of orders covered by the watermark, including rows without id_order
+    """
+    # Comparisons with an empty nullable id are NA, not False
+    return (df['id_order'] <= watermark['id_order']).fillna(True).astype(bool)
+
+def appendable(df: pd.DataFrame) -> bool:
+    """
+    Whether new orders can be appended after the watermark, which needs a
+    numeric id_order in every row. Rows without one sort last in a full run.
+    """
+    return pd.api.types.is_numeric_dtype(df['id_order']) and df['id_order'].notna().all()
+
+def write_watermark(watermark_path: Path, df: pd.DataFrame, input_hash: str) -> None:
+    """
+    Record the last processed order and what the outputs were computed from
+    """
+    if pd.api.types.is_numeric_dtype(df['id_order']) and df['id_order'].notna().any():
+        watermark = {
+            'id_order': scalar(df['id_order'].max()),
+            # Categorical dates have no order of their own, see compact_orders
+            'date_order': str(df['date_order'].astype(object).max()),
+            'input_hash': input_hash,
+            'rules_version': RULES_VERSION,
+        }
+        watermark['processed_hash'] = rows_hash(df[processed_orders(df, watermark)])
+        with open(watermark_path, 'w') as file:
+            json.dump(watermark, file, indent=2)
+        logger.info(f"Watermark at id_order {watermark['id_order']} saved to: {watermark_path}")
+    elif watermark_path.exists():
+        watermark_path.unlink()
+
+def read_watermark(watermark_path: Path, output_paths: List[Path]) -> Optional[dict]:
+    """
+    Watermark of the previous run, None if the outputs cannot be extended
+    """
+    if not watermark_path.exists():
+        logger.info("No watermark found, processing all orders")
+        return None
+    with open(watermark_path) as file:
+        watermark = json.load(file)
+    if watermark.get('rules_version') != RULES_VERSION:
+        logger.info("Country rules changed since the last run, processing all orders")
+        return None
+    if not all(path.exists() for path in output_paths):
+        logger.info("Outputs of the last run are missing, processing all orders")
+        return None
+    return watermark
+
+def append_outputs(df: pd.DataFrame, watermark: dict, mode: str,
+                   output_path: Path, invalid_path: Path, unique_path: Path,
+                   pool: Optional[ProcessPoolExecutor] = None, workers: int = 1,
+                   shard_log: Optional[List[str]] = None) -> Optional[dict]:
+    """
+    Extract only orders after the watermark and append them to the outputs
+    of the previous run. Returns the counts for the log, or None if orders
+    before the watermark changed and everything has to be reprocessed.
+    """
+    if not appendable(df):
+        logger.info("Orders without a numeric id_order cannot be appended, processing all orders")
+        return None
+    processed = processed_orders(df, watermark)
+    if rows_hash(df[processed]) != watermark['processed_hash']:
+        logger.info("Orders up to the watermark changed since the last run, processing all orders")
+        return None
+
+    new_df = df[~processed]
+    logger.info(f"Extracting phone numbers from {len(new_df)} rows after id_order {watermark['id_order']} ({mode} mode)")
+    output_df, invalid_df = extract(new_df, mode, pool, workers, shard_log)
+
+    # New orders sort after all previous ones, so appending keeps the valid file sorted
+    output_df = output_df.sort_values(SORT_COLUMNS).drop_duplicates()
+    logger.info(f"Appending {len(output_df)} valid numbers to: {output_path}")
+    output_df.to_csv(output_path, mode='a', header=False, index=False)
+
+    logger.info(f"Appending {len(invalid_df)} invalid numbers to: {invalid_path}")
+    invalid_df.to_csv(invalid_path, mode='a', header=False, index=False)
+
+    # First occurrences stay first, only numbers never seen before are added
+    known_numbers = pd.read_csv(unique_path, usecols=['phone_number'], dtype=str)['phone_number']
+    unique_df = output_df.drop_duplicates(subset=['phone_number'], keep='first')
+    unique_df = unique_df[~unique_df['phone_number'].isin(known_numbers)]
+    logger.info(f"Appending {len(unique_df)} unique numbers to: {unique_path}")
+    unique_df.to_csv(unique_path, mode='a', header=False, index=False)
+
+    # Counts for the log cover the whole outputs, not just this run
+    valid_df = pd.read_csv(output_path, usecols=['country', 'language'], dtype=str, keep_default_na=False)
+    return {'total_orders': df['id_order'].nunique(), 'valid': len(valid_df),
+            'unique': len(known_numbers) + len(unique_df),
+            'invalid': len(pd.read_csv(invalid_path, usecols=['id_order'])),
+            'countries': valid_df['country'].value_counts().to_dict(),
+            'languages': valid_df['language'].value_counts().to_dict()}
+
+def process_file(input_path: str, mode: str = 'column', disk_cache: bool = True,
+                 chunksize: Optional[int] = None, workers: int = 1, incremental: bool = False,
+                 store: bool = True) -> None:
     """
     Process input TSV file and create output CSV with standardized phone numbers
     """
+    pool = None
     try:
-        # Read input file
-        logger.info(f"Reading input file: {input_path}")
-        df = pd.read_csv(input_path, sep='\t', low_memory=False)
-        
-        # Count total unique orders
-        total_orders = df['id_order'].nunique()
-        logger.info(f"Total unique orders in input file: {total_orders}")
-        
-        # Prepare output data
-        output_data = []
-        invalid_numbers = []
-        
-        # Process each row
-        for _, row in df.iterrows():
-            if pd.isna(row['note']):
-                continue
-                
-            numbers = extract_phone_numbers(str(row['note']))
-            
-            for number in numbers:
-                cleaned_number, country, original = clean_phone_number(number)
-                if cleaned_number and is_valid_number(cleaned_number, country):
-                    # Extract language and name_sponsor from the row
-                    language = row.get('language', '').strip().lower() if not pd.isna(row.get('language', '')) else ''
-                    name_sponsor = row.get('name_sponsor', '') if not pd.isna(row.get('name_sponsor', '')) else ''
-                    
-                    # Set language strictly based on country code, regardless of input language
-                    if country == 'CZ':
-                        language = 'cs'
-                    elif country == 'DE' or country == 'AT':  # Both Germany and Austria use German
-                        language = 'de'
-                    elif country == 'PL':
-                        language = 'pl'
-                    else:
-                        language = 'en'  # Default for all other countries
-                    
-                    output_data.append({
-                        'id_order': row['id_order'],
-                        'date_order': row['date_order'],
-                        'phone_number': cleaned_number,
-                        'country': country,
-                        'language': language,
-                        'name_sponsor': name_sponsor
-                    })
-                else:
-                    invalid_numbers.append({
-                        'id_order': row['id_order'],
-                        'date_order': row['date_order'],
-                        'original_number': original,
-                        'attempted_clean': cleaned_number if cleaned_number else 'None',
-                        'attempted_country': country if country else 'None'
-                    })
-        
-        # Create output dataframes
-        output_df = pd.DataFrame(output_data)
-        invalid_df = pd.DataFrame(invalid_numbers)
-        
-        # Sort and remove duplicates
-        output_df = output_df.sort_values(['id_order', 'date_order', 'phone_number'])\
-                            .drop_duplicates()
-        
+        output_base = OUTPUT_BASE
+        output_base.mkdir(parents=True, exist_ok=True)
+
+        # Reuse normalization results of earlier runs over overlapping exports
+        CACHE.reset_stats()
+        cache_path = output_base / CACHE_FILENAME if disk_cache else None
+        if cache_path:
+            logger.info(f"Using normalization cache: {cache_path}")
+            CACHE.open(cache_path)
+
+        # Extraction runs per id_order shard in pool processes
+        shard_log = []
+        if workers > 1:
+            logger.info(f"Sharding extraction across {workers} workers")
+            pool = ProcessPoolExecutor(workers, initializer=init_worker, initargs=(cache_path,))
+
         # Generate output paths
         input_filename = Path(input_path).name
         date_range_match = re.search(r'(\d{4}-\d{2}-\d{2}_\d{4}-\d{2}-\d{2})', input_filename)
@@ -280,50 +1131,112 @@ def process_file(input_path: str) -> None:
             # Default to current date range if not found in filename
             now = datetime.now()
             date_range = f"{now.strftime('%Y-%m-%d')}_{now.strftime('%Y-%m-%d')}"
-        
-        output_base = Path("/home/hylmarj/_scratch/staging-goldsport-analytics/goldsport__phone_numbers___gsp_dataset___auto_full/method=auto_full/source=goldsport")
-        output_base.mkdir(parents=True, exist_ok=True)
-        
-        # Save valid numbers
+
         output_path = output_base / f'phone_numbers_{date_range}.csv'
-        logger.info(f"Saving {len(output_df)} valid numbers to: {output_path}")
-        output_df.to_csv(output_path, index=False)
-        
-        # Save invalid numbers to the same base path
         invalid_path = output_base / f'invalid_numbers_{date_range}.csv'
-        logger.info(f"Saving {len(invalid_df)} invalid numbers to: {invalid_path}")
-        invalid_df.to_csv(invalid_path, index=False)
-        
-        # Create and save unique phone numbers file
-        # This filters to just the unique phone numbers while keeping the first occurrence of each
-        unique_df = output_df.drop_duplicates(subset=['phone_number'], keep='first')
         unique_path = output_base / f'phone_numbers_unique_{date_range}.csv'
-        logger.info(f"Saving {len(unique_df)} unique numbers to: {unique_path}")
-        unique_df.to_csv(unique_path, index=False)
-        
+        watermark_path = output_base / f'phone_numbers_{date_range}.watermark.json'
+
+        watermark = read_watermark(watermark_path, [output_path, invalid_path, unique_path]) if incremental else None
+        input_hash = file_hash(input_path) if incremental else None
+        if watermark and watermark['input_hash'] == input_hash:
+            logger.info(f"Input unchanged since the last run, outputs are up to date: {output_path}")
+            return
+
+        if chunksize:
+            # Streamed outputs have no watermark, the next incremental run starts over
+            if watermark_path.exists():
+                watermark_path.unlink()
+            logger.info(f"Streaming input file in chunks of {chunksize} rows: {input_path}")
+            summary = stream_outputs(input_path, mode, chunksize, output_path, invalid_path, unique_path,
+                                     pool, workers, shard_log)
+            logger.info(f"Total unique orders in input file: {summary['total_orders']}")
+            logger.info(f"Saved {summary['valid']} valid numbers to: {output_path}")
+            logger.info(f"Saved {summary['invalid']} invalid numbers to: {invalid_path}")
+            logger.info(f"Saved {summary['unique']} unique numbers to: {unique_path}")
+        else:
+            # Read input file
+            logger.info(f"Reading input file: {input_path}")
+            df = read_orders(input_path)
+
+            # Count total unique orders
+            total_orders = df['id_order'].nunique()
+            logger.info(f"Total unique orders in input file: {total_orders}")
+
+            summary = None
+            if watermark:
+                summary = append_outputs(df, watermark, mode, output_path, invalid_path, unique_path,
+                                         pool, workers, shard_log)
+
+        if not chunksize and summary is None:
+            # Extract, clean and validate numbers from the notes
+            logger.info(f"Extracting phone numbers ({mode} mode)")
+            output_df, invalid_df = extract(df, mode, pool, workers, shard_log)
+
+            # Sort and remove duplicates
+            output_df = output_df.sort_values(SORT_COLUMNS).drop_duplicates()
+
+            # Save valid numbers
+            logger.info(f"Saving {len(output_df)} valid numbers to: {output_path}")
+            output_df.to_csv(output_path, index=False)
+
+            # Save invalid numbers to the same base path
+            logger.info(f"Saving {len(invalid_df)} invalid numbers to: {invalid_path}")
+            invalid_df.to_csv(invalid_path, index=False)
+
+            # Create and save unique phone numbers file
+            # This filters to just the unique phone numbers while keeping the first occurrence of each
+            unique_df = output_df.drop_duplicates(subset=['phone_number'], keep='first')
+            logger.info(f"Saving {len(unique_df)} unique numbers to: {unique_path}")
+            unique_df.to_csv(unique_path, index=False)
+
+            summary = {'total_orders': total_orders, 'valid': len(output_df), 'unique': len(unique_df),
+                       'invalid': len(invalid_df),
+                       'countries': output_df['country'].value_counts().to_dict(),
+                       'languages': output_df['language'].value_counts().to_dict()}
+
+        if not chunksize:
+            write_watermark(watermark_path, df, input_hash or file_hash(input_path))
+
+        if store:
+            # The unique file holds every number of the input whatever the mode
+            stored = upsert_phone_numbers(pd.read_csv(unique_path, dtype=str))
+            logger.info(f"Upserted {stored} unique numbers into the fact store")
+
         # Create detailed log file with same name as the output file
         log_path = output_base / f'phone_numbers_{date_range}.log'
         with open(log_path, 'w') as log_file:
             log_file.write(f"Processing completed at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
             log_file.write(f"Input file: {input_path}\n")
             log_file.write(f"Date range: {date_range}\n")
-            log_file.write(f"Total unique orders processed: {total_orders}\n")
-            log_file.write(f"Total valid phone numbers found: {len(output_df)}\n")
-            log_file.write(f"Total unique phone numbers: {len(unique_df)}\n")
-            log_file.write(f"Total invalid phone numbers: {len(invalid_df)}\n")
+            log_file.write(f"Total unique orders processed: {summary['total_orders']}\n")
+            log_file.write(f"Total valid phone numbers found: {summary['valid']}\n")
+            log_file.write(f"Total unique phone numbers: {summary['unique']}\n")
+            log_file.write(f"Total invalid phone numbers: {summary['invalid']}\n")
+
+            # Normalization cache statistics
+            log_file.write("\nNormalization cache:\n")
+            log_file.write(f"  Rules version: {CACHE.version}\n")
+            log_file.write(f"  Memory hits: {CACHE.hits}\n")
+            log_file.write(f"  Disk hits: {CACHE.disk_hits}\n")
+            log_file.write(f"  Misses: {CACHE.misses}\n")
+
+            # Shard timing
+            if shard_log:
+                log_file.write(f"\nShards ({workers} workers):\n")
+                for message in shard_log:
+                    log_file.write(f"  {message}\n")
             
             # Country statistics
-            if not output_df.empty:
+            if summary['valid']:
                 log_file.write("\nPhone numbers by country:\n")
-                country_counts = output_df['country'].value_counts().to_dict()
-                for country, count in country_counts.items():
+                for country, count in sorted(summary['countries'].items(), key=lambda item: -item[1]):
                     log_file.write(f"  {country}: {count}\n")
             
             # Language statistics
-            if not output_df.empty:
+            if summary['valid']:
                 log_file.write("\nPhone numbers by language:\n")
-                language_counts = output_df['language'].value_counts().to_dict()
-                for language, count in language_counts.items():
+                for language, count in sorted(summary['languages'].items(), key=lambda item: -item[1]):
                     log_file.write(f"  {language}: {count}\n")
         
         logger.info(f"Detailed log saved to: {log_path}")
@@ -331,16 +1244,34 @@ def process_file(input_path: str) -> None:
     except Exception as e:
         logger.error(f"Error processing file: {str(e)}")
         raise
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        CACHE.close()
 
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python3 etl_phone_numbers_enhanced.py <input_path>")
-        sys.exit(1)
-        
-    input_path = sys.argv[1]
+    parser = argparse.ArgumentParser(description="Extract and validate phone numbers from order data")
+    parser.add_argument('input_path', help="Orders TSV file")
+    parser.add_argument('--mode', choices=sorted(EXTRACTION_MODES), default='column',
+                        help="Extraction mode, 'row' is the row by row reference (default: column)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help=f"Do not read or write the {CACHE_FILENAME} normalization cache in the output directory")
+    parser.add_argument('--chunksize', type=int,
+                        help="Stream the input in chunks of this many rows and write outputs incrementally")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Processes to shard the extraction across by id_order (default: 1)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only process orders after the watermark of the previous run and append them")
+    parser.add_argument('--no-store', action='store_true',
+                        help="Do not upsert the unique numbers into the fact store")
+    args = parser.parse_args()
+    if args.incremental and args.chunksize:
+        parser.error("--incremental cannot be combined with --chunksize")
     
     try:
-        process_file(input_path)
+        process_file(args.input_path, mode=args.mode, disk_cache=not args.no_cache,
+                     chunksize=args.chunksize, workers=args.workers, incremental=args.incremental,
+                     store=not args.no_store)
     except Exception as e:
         logger.error(f"Script failed: {str(e)}")
         exit(1)
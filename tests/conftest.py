@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The ETL scripts import their common__ modules as siblings
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src' / 'etls'))
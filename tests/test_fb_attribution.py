@@ -0,0 +1,35 @@
+import pandas as pd
+import pytest
+
+from etl__fb_attribution import add_ratios, attribute
+
+def spend_frame(rows):
+    spend = pd.DataFrame(rows, columns=['campaign', 'date', 'spend'])
+    spend['date'] = pd.to_datetime(spend['date'])
+    return spend
+
+def orders_frame(rows):
+    orders = pd.DataFrame(rows, columns=['date', 'orders', 'revenue'])
+    return orders.set_index(pd.to_datetime(orders.pop('date')))
+
+def test_orders_are_split_by_spend_over_the_window():
+    spend = spend_frame([('a', '2024-12-08', 10.0), ('a', '2024-12-10', 20.0), ('b', '2024-12-10', 10.0)])
+    orders = orders_frame([('2024-12-10', 4, 400.0)])
+    result, unattributed = attribute(spend, orders, 3)
+    assert result['orders'].tolist() == pytest.approx([1.0, 2.0, 1.0])
+    assert result['revenue'].tolist() == pytest.approx([100.0, 200.0, 100.0])
+    assert unattributed['orders'] == 0
+
+def test_spend_outside_the_window_gets_no_orders():
+    spend = spend_frame([('a', '2024-12-01', 10.0), ('a', '2024-12-10', 10.0)])
+    orders = orders_frame([('2024-12-10', 2, 50.0), ('2024-12-05', 1, 30.0)])
+    result, unattributed = attribute(spend, orders, 3)
+    assert result['orders'].tolist() == pytest.approx([0.0, 2.0])
+    # The order of 2024-12-05 has no spend from 2024-12-03 on
+    assert unattributed['orders'] == 1 and unattributed['revenue'] == 30.0
+
+def test_ratios_are_empty_without_orders_or_spend():
+    result = add_ratios(pd.DataFrame({'campaign': 'a', 'date': pd.to_datetime(['2024-12-01', '2024-12-02']),
+                                      'spend': [10.0, 0.0], 'orders': [0.0, 2.0], 'revenue': [0.0, 40.0]}))
+    assert pd.isna(result.loc[0, 'cpa']) and pd.isna(result.loc[1, 'roas'])
+    assert result.loc[1, 'cpa_cumulative'] == 5.0 and result.loc[1, 'roas_cumulative'] == 4.0
@@ -0,0 +1,169 @@
+import json
+from datetime import date, timedelta
+
+import pandas as pd
+
+import etl__fb_day
+import etl__fb_to_date
+from etl__fb_reconcile import reconcile, reconcile_campaign, refetch_days
+
+CAMPAIGN = 'camp_0__traffic__120200000'
+
+def insights(name_key, name, day, spend):
+    return {'campaign_name': CAMPAIGN, name_key: name, 'reach': '10', 'impressions': '100', 'spend': spend,
+            'actions': [{'action_type': 'link_click', 'value': '5'}], 'result_type': 'Link clicks', 'results': '5',
+            'date_start': str(day), 'date_stop': str(day)}
+
+def write_day_file(insights_dir, day, spend='1.00', fetched='2025-01-15T16-47-00.000Z'):
+    date_dir = insights_dir / f'date={day}'
+    date_dir.mkdir(parents=True, exist_ok=True)
+    data = {'metadata': {'reportingPeriod': {'date': str(day), 'type': 'daily'}},
+            'campaign': {'name': CAMPAIGN, 'insights': [insights('campaign_name', CAMPAIGN, day, spend)]},
+            'ads': [{'adId': '1', 'name': 'ad 1', 'insights': [insights('ad_name', 'ad 1', day, spend)]}]}
+    path = date_dir / f'insight_1202___{CAMPAIGN}___date__{day}__czech_republic___{fetched}.json'
+    path.write_text(json.dumps(data))
+    return path
+
+def write_to_date_file(insights_dir, start, day):
+    """Snapshot of start..day with the sums of the daily files of make_campaign."""
+    days = (day - start).days + 1
+    totals = {'impressions': str(100 * days), 'spend': f'{days}.00', 'results': str(5 * days)}
+    data = {'metadata': {'reportingPeriod': {'startDate': str(start), 'endDate': str(day), 'type': 'toDate'}},
+            'campaign': {'name': CAMPAIGN, 'insights': [{**insights('campaign_name', CAMPAIGN, day, '0'), **totals}]},
+            'ads': [{'adId': '1', 'name': 'ad 1', 'insights': [{**insights('ad_name', 'ad 1', day, '0'), **totals}]}]}
+    path = (insights_dir / f'date={day}'
+            / f'insight_1202___{CAMPAIGN}___to_date__{start}_{day}__czech_republic___2025-01-15T16-47-00.000Z.json')
+    path.write_text(json.dumps(data))
+
+def make_campaign(tmp_path, monkeypatch, days=5):
+    insights_dir = tmp_path / f'campaign={CAMPAIGN}' / 'type=insights'
+    for offset in range(days):
+        write_day_file(insights_dir, date(2024, 12, 1) + timedelta(days=offset))
+    output_dir = tmp_path / 'out'
+    monkeypatch.setattr(etl__fb_day, 'get_output_directory', lambda input_path: output_dir)
+    monkeypatch.setattr(etl__fb_to_date, 'get_output_directory', lambda input_path: output_dir)
+    return insights_dir, output_dir
+
+def test_since_does_not_truncate_day_outputs(tmp_path, monkeypatch):
+    insights_dir, output_dir = make_campaign(tmp_path, monkeypatch)
+    etl__fb_day.process_campaign(insights_dir, store=False)
+    full = pd.read_csv(output_dir / 'campaign_days.csv')
+
+    etl__fb_day.process_campaign(insights_dir, since='2024-12-04', store=False)
+    ranged = pd.read_csv(output_dir / 'campaign_days.csv')
+    assert len(ranged) == 5
+    pd.testing.assert_frame_equal(ranged, full)
+    # The rolling sums still see the days before the range
+    assert ranged['spend_7d'].tolist() == [1.0, 2.0, 3.0, 4.0, 5.0]
+
+def test_since_on_first_run_keeps_days_before_range(tmp_path, monkeypatch):
+    insights_dir, output_dir = make_campaign(tmp_path, monkeypatch)
+    etl__fb_day.process_campaign(insights_dir, until='2024-12-02', store=False)
+    assert len(pd.read_csv(output_dir / 'ads_days.csv')) == 5
+
+def spend_by_day(output_dir):
+    df = pd.read_csv(output_dir / 'campaign_days.csv')
+    return dict(zip(df['date_start'], df['spend']))
+
+def test_range_limits_which_files_are_parsed_again(tmp_path, monkeypatch):
+    insights_dir, output_dir = make_campaign(tmp_path, monkeypatch)
+    etl__fb_day.process_campaign(insights_dir, store=False)
+    write_day_file(insights_dir, date(2024, 12, 1), spend='7.00')
+    write_day_file(insights_dir, date(2024, 12, 5), spend='9.00')
+
+    # The change before the range is not looked at, its previous rows stay
+    etl__fb_day.process_campaign(insights_dir, since='2024-12-04', store=False)
+    spend = spend_by_day(output_dir)
+    assert len(spend) == 5
+    assert spend['2024-12-01'] == 1.0 and spend['2024-12-05'] == 9.0
+
+    etl__fb_day.process_campaign(insights_dir, store=False)
+    assert spend_by_day(output_dir)['2024-12-01'] == 7.0
+
+def test_full_with_range_keeps_ledger_rows_of_other_days(tmp_path, monkeypatch):
+    insights_dir, output_dir = make_campaign(tmp_path, monkeypatch)
+    etl__fb_day.process_campaign(insights_dir, store=False)
+    etl__fb_day.process_campaign(insights_dir, since='2024-12-05', full=True, store=False)
+    assert len(spend_by_day(output_dir)) == 5
+
+def test_refetched_day_is_counted_once(tmp_path, monkeypatch):
+    insights_dir, output_dir = make_campaign(tmp_path, monkeypatch)
+    write_to_date_file(insights_dir, date(2024, 12, 1), date(2024, 12, 5))
+    # Fetched again later into the same date= directory
+    write_day_file(insights_dir, date(2024, 12, 3), spend='1.00', fetched='2025-01-16T08-00-00.000Z')
+    etl__fb_day.process_campaign(insights_dir, store=False)
+    etl__fb_to_date.process_campaign(insights_dir, store=False)
+
+    assert len(pd.read_csv(output_dir / 'campaign_days.csv')) == 5
+    results = reconcile_campaign(output_dir, 0.01)
+    assert not results['drifted'].any()
+    assert results['spend_daily'].tolist() == [5.0, 5.0]
+
+def test_latest_fetch_replaces_earlier_one(tmp_path, monkeypatch):
+    insights_dir, output_dir = make_campaign(tmp_path, monkeypatch)
+    etl__fb_day.process_campaign(insights_dir, store=False)
+    write_day_file(insights_dir, date(2024, 12, 3), spend='3.00', fetched='2025-01-16T08-00-00.000Z')
+    etl__fb_day.process_campaign(insights_dir, store=False)
+    assert len(pd.read_csv(output_dir / 'campaign_days.csv')) == 5
+    assert spend_by_day(output_dir)['2024-12-03'] == 3.0
+
+def daily_frame(days, spend):
+    return pd.DataFrame({'name': 'camp', 'date_start': pd.to_datetime(days), 'spend': spend,
+                         'impressions': 100.0, 'results': 5.0})
+
+def snapshot_frame(stops, spend, impressions):
+    snapshots = pd.DataFrame({'name': 'camp', 'date_start': pd.Timestamp('2024-12-01'),
+                              'date_stop': pd.to_datetime(stops), 'spend': spend, 'impressions': impressions})
+    snapshots['results'] = snapshots['impressions'] / 20
+    return snapshots
+
+def test_reconcile_flags_only_the_day_drift_appears():
+    daily = daily_frame(['2024-12-01', '2024-12-02', '2024-12-03'], [1.0, 1.0, 1.0])
+    # The snapshot of the 2nd has 0.5 more spend than the days, later snapshots carry it
+    snapshots = snapshot_frame(['2024-12-01', '2024-12-02', '2024-12-03'], [1.0, 2.5, 3.5], [100.0, 200.0, 300.0])
+    results = reconcile(daily, snapshots, 0.01)
+    assert results['spend_drift'].tolist() == [0.0, 0.5, 0.5]
+    assert results['drifted'].tolist() == [False, True, False]
+    assert refetch_days(results)['date'].tolist() == [pd.Timestamp('2024-12-02')]
+
+def test_reconcile_flags_missing_daily_rows():
+    daily = daily_frame(['2024-12-01', '2024-12-03'], [1.0, 1.0])
+    snapshots = snapshot_frame(['2024-12-01', '2024-12-02', '2024-12-03'], [1.0, 1.0, 2.0], [100.0, 100.0, 200.0])
+    results = reconcile(daily, snapshots, 0.01)
+    assert results['days_missing'].tolist() == [0, 1, 1]
+    assert results['missing_days'].tolist() == [False, True, False]
+    assert not results['drifted'].any()
+
+def test_reconcile_sums_ads_sharing_a_name():
+    days = ['2024-12-01', '2024-12-02', '2024-12-03']
+    daily = pd.concat([daily_frame(days, 1.0), daily_frame(days, 2.0)], ignore_index=True)
+    snapshots = pd.concat([snapshot_frame(days, [1.0, 2.0, 3.0], [100.0, 200.0, 300.0]),
+                           snapshot_frame(days, [2.0, 4.0, 6.0], [100.0, 200.0, 300.0])], ignore_index=True)
+    results = reconcile(daily, snapshots, 0.01)
+    assert results['spend_to_date'].tolist() == [3.0, 6.0, 9.0]
+    assert results['spend_drift'].tolist() == [0.0, 0.0, 0.0]
+    assert not (results['drifted'] | results['missing_days']).any()
+
+def kpi_frame(names, days, spend, **columns):
+    return pd.DataFrame({'name': names, 'date_start': pd.to_datetime(days), 'reach': 50.0, 'impressions': 200.0,
+                         'spend': spend, 'results': '4', 'actions__link_click': 10.0,
+                         'video_p25_watched_actions': 100.0, 'video_p50_watched_actions': 50.0,
+                         'video_p75_watched_actions': 25.0, 'video_p100_watched_actions': 10.0, **columns})
+
+def test_kpi_columns():
+    df = etl__fb_day.add_kpis(kpi_frame(['ad 1', 'ad 2'], ['2024-12-01'] * 2, [2.0, 3.0],
+                                        reach=[50.0, 0.0], impressions=[200.0, 0.0], results=['4', '0'],
+                                        actions__link_click=[10.0, None], video_p25_watched_actions=[100.0, 0.0]))
+    first = df.iloc[0]
+    assert (first['cpm'], first['ctr'], first['frequency'], first['cost_per_result']) == (10.0, 0.05, 4.0, 0.5)
+    assert (first['video_retention_p50'], first['video_retention_p75'], first['video_retention_p100']) == (0.5, 0.25, 0.1)
+    # Zero denominators leave the ratios empty, missing link clicks count as 0
+    kpis = ['cpm', 'ctr', 'frequency', 'cost_per_result', 'video_retention_p50']
+    assert df.iloc[1][kpis].isna().all()
+    assert df.iloc[1]['link_clicks_7d'] == 0.0
+
+def test_rolling_sums_keep_ads_sharing_a_name_apart():
+    days = ['2024-12-01', '2024-12-01', '2024-12-02', '2024-12-02', '2024-12-09', '2024-12-09']
+    df = etl__fb_day.add_kpis(kpi_frame(['ad 1'] * 6, days, [1.0, 10.0, 2.0, 20.0, 4.0, 40.0]))
+    assert df['spend_7d'].tolist() == [1.0, 10.0, 3.0, 30.0, 4.0, 40.0]
+    assert df['results_7d'].tolist() == [4.0, 4.0, 8.0, 8.0, 4.0, 4.0]
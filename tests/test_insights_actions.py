@@ -0,0 +1,35 @@
+import pandas as pd
+
+from common__insights import INSIGHT_COLUMNS, RecordAccumulator, action_index, insight_record, wide_actions
+
+def entry(**fields):
+    return {'reach': '10', 'impressions': '100', 'spend': '2.5', 'result_type': 'Link clicks', **fields}
+
+def test_action_index_keeps_first_entry_of_a_type():
+    actions = [{'action_type': 'link_click', 'value': '5'}, {'action_type': 'link_click', 'value': '7'},
+               {'action_type': 'lead'}]
+    assert action_index(actions) == {'link_click': '5', 'lead': 0}
+    assert action_index(None) == {} and action_index(3) == {}
+
+def test_wide_actions_columns_and_values():
+    columns = wide_actions(entry(actions=[{'action_type': 'link_click', 'value': '5'},
+                                          {'action_type': 'video_view', 'value': 'n/a'}],
+                                 action_values=[{'action_type': 'offsite_conversion.fb_pixel_purchase', 'value': '99.9'}],
+                                 cost_per_action_type=[{'action_type': 'link_click', 'value': '0.5'}]))
+    assert columns == {'actions__link_click': 5.0, 'actions__video_view': None,
+                       'action_values__offsite_conversion.fb_pixel_purchase': 99.9,
+                       'cost_per_action__link_click': 0.5}
+
+def test_absent_actions_are_empty_in_the_frame():
+    records = RecordAccumulator(INSIGHT_COLUMNS)
+    first = entry(actions=[{'action_type': 'link_click', 'value': '5'}],
+                  cost_per_action_type=[{'action_type': 'lead', 'value': '2'}])
+    second = entry(actions=[{'action_type': 'lead', 'value': '1'}])
+    records.append(insight_record(first, 'ad 1', 'day_ad', '2024-12-01', '2024-12-01', '5'))
+    records.append(insight_record(second, 'ad 2', 'day_ad', '2024-12-01', '2024-12-01', '1'))
+    df = records.to_frame()
+    # Wide columns follow the fixed ones, grouped by action list
+    assert df.columns.tolist() == [*INSIGHT_COLUMNS, 'actions__lead', 'actions__link_click', 'cost_per_action__lead']
+    assert df['actions__link_click'].tolist()[0] == 5.0 and pd.isna(df['actions__link_click'].iloc[1])
+    assert pd.isna(df['actions__lead'].iloc[0]) and df['actions__lead'].iloc[1] == 1.0
+    assert df['video_p25_watched_actions'].tolist() == [0, 0]
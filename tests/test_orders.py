@@ -0,0 +1,97 @@
+import sys
+
+import pandas as pd
+import pytest
+
+import etl__orders
+
+HEADER = ['id_order', 'date_order', 'contact_sales', 'location_meeting', 'season', 'level', 'group_size',
+          'participants', 'language', 'name_sponsor', 'name_participant', 'age_participant', 'date_lesson',
+          'timestamp_start_lesson', 'timestamp_end_lesson', 'price_currency', 'price_discount_percent',
+          'price_without_vat', 'price_to_pay', 'note']
+
+def order(id_order, season, date_order, price):
+    return [str(id_order), date_order, 'x', 'Harrachov', season, 'A', '1', '2', 'cz', 'Jan', 'p', '16', date_order,
+            f'{date_order}T09:00:00+01:00', f'{date_order}T11:00:00+01:00', 'CZK', '0', '300', str(price), 'tel 777']
+
+def write_input(path, rows):
+    path.write_text('\t'.join(HEADER) + '\n' + ''.join('\t'.join(row) + '\n' for row in rows))
+
+def run(monkeypatch, capsys, input_path, output_path, *args):
+    monkeypatch.setattr(etl__orders, 'INPUT_PATH', str(input_path))
+    monkeypatch.setattr(etl__orders, 'OUTPUT_PATH', str(output_path))
+    monkeypatch.setattr(sys, 'argv', ['etl__orders.py', '--no-store', *args])
+    etl__orders.main()
+    return capsys.readouterr().out
+
+def test_manifest_rewrites_only_changed_seasons(tmp_path, monkeypatch, capsys):
+    input_path, output_path = tmp_path / 'in', tmp_path / 'out'
+    input_path.mkdir()
+    write_input(input_path / 'a.tsv', [order(4000, '23/24', '2024-01-16', 1452), order(4001, '23/24', '2024-03-10', 900)])
+    write_input(input_path / 'b.tsv', [order(5000, '24/25', '2024-12-20', 1200)])
+    run(monkeypatch, capsys, input_path, output_path)
+    assert 'No input changes' in run(monkeypatch, capsys, input_path, output_path)
+
+    earlier_season = output_path / 'orders_2023-12-01_2024-03-31.tsv'
+    earlier_mtime = earlier_season.stat().st_mtime_ns
+    write_input(input_path / 'b.tsv', [order(5000, '24/25', '2024-12-20', 1300), order(5001, '24/25', '2025-01-05', 700)])
+    assert "Seasons to write: ['24/25']" in run(monkeypatch, capsys, input_path, output_path)
+    assert earlier_season.stat().st_mtime_ns == earlier_mtime
+
+    run(monkeypatch, capsys, input_path, tmp_path / 'full', '--full')
+    for name in ['orders_2023-12-01_2024-03-31.tsv', 'orders_2024-12-01_2025-03-31.tsv']:
+        assert (output_path / name).read_text() == (tmp_path / 'full' / name).read_text()
+
+def test_removed_input_rewrites_its_season(tmp_path, monkeypatch, capsys):
+    input_path, output_path = tmp_path / 'in', tmp_path / 'out'
+    input_path.mkdir()
+    write_input(input_path / 'a.tsv', [order(5000, '24/25', '2024-12-20', 1200)])
+    write_input(input_path / 'b.tsv', [order(5001, '24/25', '2025-01-05', 700)])
+    run(monkeypatch, capsys, input_path, output_path)
+    (input_path / 'b.tsv').unlink()
+    assert "Seasons to write: ['24/25']" in run(monkeypatch, capsys, input_path, output_path)
+    assert '5001' not in (output_path / 'orders_2024-12-01_2025-03-31.tsv').read_text()
+
+def test_failed_season_write_is_redone_next_run(tmp_path, monkeypatch, capsys):
+    input_path, output_path = tmp_path / 'in', tmp_path / 'out'
+    input_path.mkdir()
+    write_input(input_path / 'a.tsv', [order(5000, '24/25', '2024-12-20', 1200)])
+    run(monkeypatch, capsys, input_path, output_path)
+    write_input(input_path / 'a.tsv', [order(5000, '24/25', '2024-12-20', 1300)])
+
+    def fail(season_df, output_file, parquet=False):
+        raise OSError("disk full")
+    with monkeypatch.context() as patched:
+        patched.setattr(etl__orders, 'write_season', fail)
+        with pytest.raises(OSError):
+            run(monkeypatch, capsys, input_path, output_path)
+
+    assert "Seasons to write: ['24/25']" in run(monkeypatch, capsys, input_path, output_path)
+    assert '1300' in (output_path / 'orders_2024-12-01_2025-03-31.tsv').read_text()
+
+def test_lesson_timestamps_are_parsed_and_normalized():
+    column = pd.Series(['2024-01-02T09:00:00 +01:00', '2024-01-02 09:00:00 +01:00', '2024-01-02T09:00+01:00',
+                        '2024-01-02T09:00:00', '2024-01-02T08:00:00Z', 'soon', 'soon', '10:00', None])
+    parsed, malformed, malformed_rows = etl__orders.parse_lesson_timestamps(column)
+    assert malformed == ['soon', '10:00'] and malformed_rows == 3
+    formatted = etl__orders.format_lesson_timestamps(parsed)
+    assert formatted[:5].tolist() == ['2024-01-02T09:00:00 +01:00'] * 5 and formatted[5:].isna().all()
+
+def test_lesson_columns_are_derived_from_timestamps(capsys):
+    rows = [order(5000, '24/25', '2024-12-20', 1200), order(5001, '24/25', '2024-12-21', 700)]
+    rows[1][HEADER.index('timestamp_end_lesson')] = 'later'
+    df = etl__orders.validate_and_fix_dataframe(pd.DataFrame(rows, columns=HEADER), 'a.tsv')
+    assert 'Malformed timestamp_end_lesson in a.tsv: 1 rows, 1 distinct values' in capsys.readouterr().out
+    assert df['duration_lesson_minutes'].tolist()[0] == 120.0 and pd.isna(df['duration_lesson_minutes'].iloc[1])
+    assert df['date_start_lesson'].tolist() == [pd.Timestamp('2024-12-20'), pd.Timestamp('2024-12-21')]
+
+def test_string_mask_matches_value_types():
+    assert etl__orders.string_mask(pd.Series(['3001', 'abc', None])).tolist() == [True, True, False]
+    assert etl__orders.string_mask(pd.Series([1, 'a', None, 2.5], dtype=object)).tolist() == [False, True, False, False]
+    assert not etl__orders.string_mask(pd.Series([3001, 3002])).any()
+
+def test_shifted_rows_get_synthesized_ids(capsys):
+    rows = [order(5000, '24/25', '2024-12-20', 1200), order('Harrachov', '24/25', '2024-12-21', 700)]
+    df = etl__orders.validate_and_fix_dataframe(pd.DataFrame(rows, columns=HEADER), 'a.tsv')
+    assert 'Shifted rows: 2' in capsys.readouterr().out
+    assert df['id_order'].tolist() == [3000, 3001]
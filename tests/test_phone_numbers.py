@@ -0,0 +1,118 @@
+import re
+
+import etl__phone_numbers as phone
+from etl__phone_numbers import NORMALIZER, NormalizationCache, RULES_VERSION, clean_phone_number, sub_lines
+
+def test_number_with_newline_normalizes_like_reference():
+    assert clean_phone_number('777 123\n456')[:2] == ('+420777123456', 'CZ')
+    assert clean_phone_number('777 123\n456')[:2] == phone.clean_phone_number_reference('777 123\n456')[:2]
+
+def test_newline_in_batch_keeps_later_results_aligned():
+    cache = NormalizationCache(NORMALIZER, RULES_VERSION)
+    numbers = ['777\n123456', '777123456', '+421 905\r123 456']
+    assert cache.normalize_many(numbers) == [NORMALIZER.normalize(number) for number in numbers]
+    assert cache.normalize_many(numbers)[1] == ('+420777123456', 'CZ')
+
+def test_sub_lines_falls_back_for_strings_with_newlines():
+    steps = [(re.compile(r'[^\d\n]'), '')]
+    assert sub_lines(['1 2', '3\n4', '5-6'], steps) == ['12', '3\n4', '56']
+    assert sub_lines(['1 2', '5-6'], steps) == ['12', '56']
+
+def test_cache_ignores_results_of_older_normalizer(tmp_path):
+    path = tmp_path / 'cache.sqlite'
+    cache = NormalizationCache(NORMALIZER, RULES_VERSION)
+    cache.open(path)
+    # A wrong result stored under the rules-only key of the previous normalizer
+    old_version = phone.hashlib.sha1(repr(phone.COUNTRY_RULES).encode()).hexdigest()[:12]
+    with cache.connection:
+        cache.connection.execute("INSERT INTO normalized VALUES (?, ?, ?, ?)", ['777123456', old_version, None, None])
+    assert cache.normalize_many(['777123456']) == [('+420777123456', 'CZ')]
+    assert cache.disk_hits == 0
+    cache.close()
+
+    reopened = NormalizationCache(NORMALIZER, RULES_VERSION)
+    reopened.open(path)
+    assert reopened.normalize_many(['777123456']) == [('+420777123456', 'CZ')]
+    assert reopened.disk_hits == 1
+    reopened.close()
+
+def write_orders(path, rows):
+    path.write_text('id_order\tdate_order\tnote\tname_sponsor\n'
+                    + ''.join(f'{id_order}\t{date}\t{note}\tX\n' for id_order, date, note in rows))
+
+def test_chunked_output_matches_single_pass_with_empty_id(tmp_path, monkeypatch):
+    input_path = tmp_path / 'orders_2024-12-01_2025-03-31.tsv'
+    write_orders(input_path, [('' if i == 25 else 3000 + i, f'2024-12-0{1 + i % 9}', f'tel 777 123 {100 + i}')
+                              for i in range(40)])
+    outputs = {}
+    for name, options in {'single': {}, 'chunked': {'chunksize': 10}, 'row': {'mode': 'row', 'chunksize': 10}}.items():
+        monkeypatch.setattr(phone, 'OUTPUT_BASE', tmp_path / name)
+        phone.process_file(str(input_path), disk_cache=False, store=False, **options)
+        outputs[name] = (tmp_path / name / 'phone_numbers_2024-12-01_2025-03-31.csv').read_text()
+    assert outputs['chunked'] == outputs['single'] == outputs['row']
+    assert '3000,2024-12-01' in outputs['single'] and '.0,' not in outputs['single']
+
+def order_rows(ids):
+    return [(id_order, f'2024-12-{1 + id_order % 28:02d}', f'tel 777 123 {id_order % 1000:03d}, +421 905 {id_order}')
+            for id_order in ids]
+
+def outputs_of(output_base):
+    return {path.name: path.read_text() for path in output_base.glob('*.csv')}
+
+def test_incremental_run_appends_like_a_full_run(tmp_path, monkeypatch, caplog):
+    input_path = tmp_path / 'orders_2024-12-01_2025-03-31.tsv'
+    monkeypatch.setattr(phone, 'OUTPUT_BASE', tmp_path / 'incremental')
+    write_orders(input_path, order_rows(range(3000, 3020)))
+    phone.process_file(str(input_path), disk_cache=False, store=False, incremental=True)
+    # Later orders, one repeating a number already seen
+    write_orders(input_path, order_rows([*range(3000, 3020), 3020, 3021, 4005]))
+    with caplog.at_level('INFO'):
+        phone.process_file(str(input_path), disk_cache=False, store=False, incremental=True)
+    assert 'Extracting phone numbers from 3 rows after id_order 3019' in caplog.text
+
+    monkeypatch.setattr(phone, 'OUTPUT_BASE', tmp_path / 'full')
+    phone.process_file(str(input_path), disk_cache=False, store=False)
+    assert len(outputs_of(tmp_path / 'full')) == 3
+    assert outputs_of(tmp_path / 'incremental') == outputs_of(tmp_path / 'full')
+
+def test_incremental_run_redoes_all_when_processed_orders_change(tmp_path, monkeypatch, caplog):
+    input_path = tmp_path / 'orders_2024-12-01_2025-03-31.tsv'
+    monkeypatch.setattr(phone, 'OUTPUT_BASE', tmp_path / 'incremental')
+    rows = order_rows(range(3000, 3010))
+    write_orders(input_path, rows)
+    phone.process_file(str(input_path), disk_cache=False, store=False, incremental=True)
+    rows[2] = (3002, rows[2][1], 'tel 777 999 888')
+    write_orders(input_path, rows)
+    with caplog.at_level('INFO'):
+        phone.process_file(str(input_path), disk_cache=False, store=False, incremental=True)
+    assert 'Orders up to the watermark changed' in caplog.text
+
+    monkeypatch.setattr(phone, 'OUTPUT_BASE', tmp_path / 'full')
+    phone.process_file(str(input_path), disk_cache=False, store=False)
+    assert outputs_of(tmp_path / 'incremental') == outputs_of(tmp_path / 'full')
+
+def incremental_matches_full(tmp_path, monkeypatch, first_rows, rows):
+    input_path = tmp_path / 'orders_2024-12-01_2025-03-31.tsv'
+    monkeypatch.setattr(phone, 'OUTPUT_BASE', tmp_path / 'incremental')
+    write_orders(input_path, first_rows)
+    phone.process_file(str(input_path), disk_cache=False, store=False, incremental=True)
+    write_orders(input_path, rows)
+    phone.process_file(str(input_path), disk_cache=False, store=False, incremental=True)
+
+    monkeypatch.setattr(phone, 'OUTPUT_BASE', tmp_path / 'full')
+    phone.process_file(str(input_path), disk_cache=False, store=False)
+    assert len(outputs_of(tmp_path / 'full')) == 3
+    assert outputs_of(tmp_path / 'incremental') == outputs_of(tmp_path / 'full')
+
+def test_incremental_run_keeps_new_order_without_id(tmp_path, monkeypatch):
+    rows = order_rows(range(3000, 3010))
+    incremental_matches_full(tmp_path, monkeypatch, rows,
+                             [*rows, ('', '2024-12-20', 'tel 777 555 111'), *order_rows([3010])])
+
+def test_incremental_run_keeps_earlier_order_without_id_last(tmp_path, monkeypatch):
+    rows = [*order_rows(range(3000, 3010)), ('', '2024-12-20', 'tel 777 555 111')]
+    incremental_matches_full(tmp_path, monkeypatch, rows, [*rows, *order_rows([3010, 3011])])
+
+def test_incremental_run_with_non_numeric_ids(tmp_path, monkeypatch):
+    rows = [*order_rows(range(3000, 3005)), ('A-17', '2024-12-20', 'tel 777 555 111')]
+    incremental_matches_full(tmp_path, monkeypatch, rows, [*rows, *order_rows([3010])])
@@ -0,0 +1,68 @@
+import sqlite3
+
+import pandas as pd
+
+from common__store import open_store, upsert_insights, upsert_orders, upsert_phone_numbers
+
+def phone_row(number, id_order, date_order, name_sponsor='Jan'):
+    return {'id_order': id_order, 'date_order': date_order, 'phone_number': number, 'country': 'CZ',
+            'language': 'cs', 'name_sponsor': name_sponsor}
+
+def stored(path, sql):
+    connection = open_store(path)
+    try:
+        return connection.execute(sql).fetchall()
+    finally:
+        connection.close()
+
+def test_phone_numbers_keep_first_seen_order(tmp_path):
+    path = tmp_path / 'store.sqlite'
+    upsert_phone_numbers(pd.DataFrame([phone_row('+420777123456', '3001', '2024-12-01')]), path)
+    # A later file with the same number does not move it to the later order
+    upsert_phone_numbers(pd.DataFrame([phone_row('+420777123456', '4001', '2025-01-10', 'Petr')]), path)
+    assert stored(path, "SELECT id_order, date_order, name_sponsor FROM phone_numbers") == [(3001, '2024-12-01', 'Jan')]
+    # An earlier order found later does
+    upsert_phone_numbers(pd.DataFrame([phone_row('+420777123456', '2001', '2024-11-02', 'Eva')]), path)
+    assert stored(path, "SELECT id_order, date_order, name_sponsor FROM phone_numbers") == [(2001, '2024-11-02', 'Eva')]
+
+def test_phone_number_without_date_takes_dated_order(tmp_path):
+    path = tmp_path / 'store.sqlite'
+    upsert_phone_numbers(pd.DataFrame([phone_row('+420777123456', '3001', None)]), path)
+    upsert_phone_numbers(pd.DataFrame([phone_row('+420777123456', '4001', '2025-01-10')]), path)
+    upsert_phone_numbers(pd.DataFrame([phone_row('+420777123456', '5001', None)]), path)
+    assert stored(path, "SELECT id_order, date_order FROM phone_numbers") == [(4001, '2025-01-10')]
+
+def insights_frame(names, spend):
+    return pd.DataFrame({'name': names, 'type': 'day_ad', 'reach': 1.0, 'impressions': 10.0, 'spend': spend,
+                         'video_p25_watched_actions': None, 'video_p50_watched_actions': None,
+                         'video_p75_watched_actions': None, 'video_p100_watched_actions': None,
+                         'date_start': '2024-12-01', 'date_stop': '2024-12-01', 'result_type': 'Link clicks',
+                         'results': 1, 'actions__link_click': 1.0})
+
+def test_insights_keep_ads_sharing_a_name(tmp_path):
+    path = tmp_path / 'store.sqlite'
+    campaign_df = insights_frame(['camp'], 3.0)
+    upsert_insights('camp', 'day', campaign_df, insights_frame(['ad 1', 'ad 1', 'ad 2'], [1.0, 1.5, 0.5]), path)
+    assert stored(path, "SELECT SUM(spend), COUNT(*) FROM insights WHERE level = 'ad'") == [(3.0, 3)]
+    # Rows gone from the outputs are gone from the store
+    upsert_insights('camp', 'day', campaign_df, insights_frame(['ad 1'], 1.0), path)
+    assert stored(path, "SELECT name, line, spend FROM insights WHERE level = 'ad'") == [('ad 1', 0, 1.0)]
+
+def test_insights_of_older_store_are_rebuilt(tmp_path):
+    path = tmp_path / 'store.sqlite'
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE insights (campaign TEXT, kind TEXT, level TEXT, name TEXT, date_start TEXT, "
+                       "date_stop TEXT, PRIMARY KEY (campaign, kind, level, name, date_start, date_stop))")
+    connection.close()
+    upsert_insights('camp', 'day', insights_frame(['camp'], 3.0), insights_frame(['ad 1', 'ad 1'], 1.0), path)
+    assert stored(path, "SELECT COUNT(*) FROM insights") == [(3,)]
+
+def test_orders_replace_their_season_only(tmp_path):
+    path = tmp_path / 'store.sqlite'
+    season = pd.DataFrame({'id_order': [1, 1, 2], 'date_order': '2024-12-01', 'season': '24/25',
+                           'price_to_pay': [10.0, 20.0, 5.0]})
+    upsert_orders('24/25', season, path)
+    upsert_orders('23/24', season.iloc[:1].assign(season='23/24'), path)
+    upsert_orders('24/25', season.iloc[1:], path)
+    assert stored(path, "SELECT season, id_order, line, price_to_pay FROM orders ORDER BY season, id_order") == [
+        ('23/24', 1, 0, 10.0), ('24/25', 1, 0, 20.0), ('24/25', 2, 0, 5.0)]